@@ -0,0 +1,60 @@
+import argparse
+import os
+import sys
+import time
+
+from torch.utils.data import DataLoader
+from torchvision import datasets
+
+# Get absolute paths
+script_dir = os.path.dirname(os.path.abspath(__file__))
+ml_dir = os.path.dirname(script_dir)
+
+sys.path.insert(0, os.path.join(ml_dir, 'training'))
+from train import get_transforms
+from shards import ShardDataset
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image-dir", type=str, default=os.path.join(ml_dir, 'data', 'processed', 'train'))
+    parser.add_argument("--shard-dir", type=str, default=None, help="Packed shards of --image-dir")
+    parser.add_argument("--img-size", type=int, default=224)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--num-workers", type=int, default=4)
+    parser.add_argument("--batches", type=int, default=50)
+    return parser.parse_args()
+
+def measure(dataset, args):
+    """Samples/sec for the training transform through a DataLoader"""
+    loader = DataLoader(dataset, batch_size=args.batch_size, shuffle=True,
+                        num_workers=args.num_workers, drop_last=True)
+    iterator = iter(loader)
+    next(iterator)  # Exclude worker start-up from the measurement
+    
+    samples = 0
+    start = time.perf_counter()
+    for _ in range(args.batches):
+        try:
+            images, _ = next(iterator)
+        except StopIteration:
+            break
+        samples += images.size(0)
+    return samples / (time.perf_counter() - start)
+
+def main():
+    args = parse_args()
+    train_transform, _ = get_transforms(args.img_size)
+    
+    results = {'ImageFolder': measure(datasets.ImageFolder(args.image_dir, transform=train_transform), args)}
+    if args.shard_dir:
+        results['Shards'] = measure(ShardDataset(args.shard_dir, transform=train_transform), args)
+    
+    print("\n" + "="*40)
+    for name, throughput in results.items():
+        print(f"{name:15s} {throughput:10.1f} samples/sec")
+    if 'Shards' in results:
+        print(f"{'Speedup':15s} {results['Shards'] / results['ImageFolder']:10.2f}x")
+    print("="*40)
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
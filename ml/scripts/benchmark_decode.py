@@ -0,0 +1,99 @@
+import argparse
+import io
+import multiprocessing as mp
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+# Get absolute paths
+script_dir = os.path.dirname(os.path.abspath(__file__))
+ml_dir = os.path.dirname(script_dir)
+
+sys.path.insert(0, os.path.join(ml_dir, 'training'))
+from inference import TRANSFORM, decode_image, simplejpeg
+
+# Typical phone/camera sizes up to a 12MP photo
+RESOLUTIONS = [(1024, 768), (1920, 1440), (3024, 2268), (4032, 3024)]
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--quality", type=int, default=90)
+    return parser.parse_args()
+
+def synthetic_photo(width, height, quality):
+    """Smooth gradients plus mild noise, so JPEG sizes resemble real photos rather than pure noise"""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    pixels = np.stack([
+        128 + 100 * np.sin(x / 97.0),
+        128 + 100 * np.cos(y / 131.0),
+        128 + 100 * np.sin((x + y) / 173.0)
+    ], axis=-1)
+    pixels += rng.normal(0, 12, pixels.shape)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels.clip(0, 255).astype(np.uint8)).save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+def preprocess(image_bytes, fast):
+    """input_fn decode plus the predict_fn transform"""
+    return TRANSFORM(decode_image(image_bytes, fast=fast))
+
+def measure_latency(image_bytes, fast, iterations):
+    """Median decode + transform latency in ms"""
+    timings = []
+    for _ in range(iterations + 2):
+        start = time.perf_counter()
+        preprocess(image_bytes, fast)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings[2:]))
+
+def _peak_rss_worker(image_bytes, fast, result_queue):
+    # Peak resident memory growth while handling one request in a fresh process
+    def vm(key):
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(key + ":"):
+                    return int(line.split()[1]) / 1024
+    before = vm("VmHWM")
+    preprocess(image_bytes, fast)
+    result_queue.put(vm("VmHWM") - before)
+
+def measure_peak_memory(image_bytes, fast):
+    """Extra peak RSS (MB) for one request; None where /proc is unavailable"""
+    if not os.path.exists("/proc/self/status"):
+        return None
+    ctx = mp.get_context("fork")
+    result_queue = ctx.Queue()
+    process = ctx.Process(target=_peak_rss_worker, args=(image_bytes, fast, result_queue))
+    process.start()
+    result = result_queue.get()
+    process.join()
+    return result
+
+def main():
+    args = parse_args()
+    decoder = "simplejpeg" if simplejpeg is not None else "PIL draft"
+    
+    print("\n" + "="*86)
+    print(f"Decode + transform per request (fast path: {decoder})")
+    print(f"{'Source':>11s} {'JPEG KB':>8s} {'Decoded':>11s} {'Full ms':>8s} {'Fast ms':>8s} {'Speedup':>8s} "
+          f"{'Full MB':>8s} {'Fast MB':>8s}")
+    print("="*86)
+    for width, height in RESOLUTIONS:
+        image_bytes = synthetic_photo(width, height, args.quality)
+        decoded = decode_image(image_bytes, fast=True).size
+        full_ms = measure_latency(image_bytes, False, args.iterations)
+        fast_ms = measure_latency(image_bytes, True, args.iterations)
+        full_mb = measure_peak_memory(image_bytes, False)
+        fast_mb = measure_peak_memory(image_bytes, True)
+        memory = f"{full_mb:>8.1f} {fast_mb:>8.1f}" if full_mb is not None else f"{'n/a':>8s} {'n/a':>8s}"
+        print(f"{f'{width}x{height}':>11s} {len(image_bytes) / 1024:>8.0f} {f'{decoded[0]}x{decoded[1]}':>11s} "
+              f"{full_ms:>8.1f} {fast_ms:>8.1f} {full_ms / fast_ms:>7.1f}x {memory}")
+    print("="*86)
+
+if __name__ == '__main__':
+    main()
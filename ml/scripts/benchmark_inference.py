@@ -0,0 +1,120 @@
+import argparse
+import io
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image
+
+# Get absolute paths
+script_dir = os.path.dirname(os.path.abspath(__file__))
+ml_dir = os.path.dirname(script_dir)
+
+sys.path.insert(0, os.path.join(ml_dir, 'training'))
+from inference import model_fn, input_fn, predict_fn, predict_batch_fn
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-dir", type=str, default=os.path.join(ml_dir, 'models'))
+    parser.add_argument("--image-dir", type=str, default=os.path.join(ml_dir, 'data', 'processed', 'validation'),
+                       help="Folder of sample images (falls back to synthetic JPEGs)")
+    parser.add_argument("--batch-sizes", type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument("--backends", type=str, nargs='+', default=["eager"],
+                       choices=["eager", "torchscript", "onnx", "int8"])
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    
+    # Concurrent single-image requests through predict_fn (micro-batcher)
+    parser.add_argument("--concurrency", type=int, default=0, help="Client threads; 0 skips the test")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    return parser.parse_args()
+
+def load_sample_images(image_dir, count):
+    """Load raw JPEG bytes from the validation set, or synthesize them"""
+    paths = sorted(Path(image_dir).rglob("*.jpg"))[:count] if os.path.isdir(image_dir) else []
+    if paths:
+        return [path.read_bytes() for path in paths]
+    
+    print(f"⚠️  No images found in {image_dir}, using synthetic 1024x768 JPEGs")
+    rng = np.random.default_rng(0)
+    samples = []
+    for _ in range(count):
+        buffer = io.BytesIO()
+        pixels = rng.integers(0, 256, size=(768, 1024, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+        samples.append(buffer.getvalue())
+    return samples
+
+def benchmark_batch(images, model_dict, iterations, warmup):
+    """Return images/sec for predict_batch_fn on a pre-decoded batch"""
+    for _ in range(warmup):
+        predict_batch_fn(images, model_dict)
+    
+    start = time.perf_counter()
+    for _ in range(iterations):
+        predict_batch_fn(images, model_dict)
+    elapsed = time.perf_counter() - start
+    
+    return len(images) * iterations / elapsed
+
+def benchmark_concurrent(images, model_dict, concurrency, num_requests):
+    """Fire single-image predict_fn calls from several threads and time each"""
+    def request(i):
+        start = time.perf_counter()
+        predict_fn(images[i % len(images)], model_dict)
+        return time.perf_counter() - start
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(request, range(num_requests)))
+    elapsed = time.perf_counter() - start
+    
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {'throughput': num_requests / elapsed, 'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99}
+
+def main():
+    args = parse_args()
+    
+    if args.concurrency > 0:
+        os.environ['INFERENCE_MAX_BATCH_SIZE'] = str(args.max_batch_size)
+        os.environ['INFERENCE_MAX_BATCH_WAIT_MS'] = str(args.max_wait_ms)
+    
+    samples = load_sample_images(args.image_dir, max(args.batch_sizes))
+    decoded = [input_fn(sample, 'application/x-image') for sample in samples]
+    
+    for backend in args.backends:
+        os.environ['INFERENCE_BACKEND'] = backend
+        start = time.perf_counter()
+        model_dict = model_fn(args.model_dir)
+        load_time = time.perf_counter() - start
+        print(f"\nBackend: {backend} | Device: {model_dict['device']} | "
+              f"Threads: {torch.get_num_threads()} | Load: {load_time:.2f}s")
+        
+        print("="*40)
+        print(f"{'Batch size':>12} {'Images/sec':>12} {'ms/batch':>12}")
+        print("="*40)
+        for batch_size in args.batch_sizes:
+            # Repeat samples if the image folder is smaller than the batch
+            images = [decoded[i % len(decoded)] for i in range(batch_size)]
+            throughput = benchmark_batch(images, model_dict, args.iterations, args.warmup)
+            print(f"{batch_size:>12d} {throughput:>12.1f} {1000 * batch_size / throughput:>12.1f}")
+        print("="*40)
+    
+    if args.concurrency > 0:
+        result = benchmark_concurrent(decoded, model_dict, args.concurrency, args.requests)
+        stats = model_dict['batcher'].stats()
+        print(f"\nMicro-batching: concurrency={args.concurrency} max_batch={args.max_batch_size} "
+              f"max_wait={args.max_wait_ms}ms")
+        print(f"  Throughput: {result['throughput']:.1f} images/sec")
+        print(f"  Latency:    p50 {result['p50_ms']:.1f}ms / p95 {result['p95_ms']:.1f}ms / p99 {result['p99_ms']:.1f}ms")
+        print(f"  Batch sizes:  {stats['batch_size_histogram']}")
+        print(f"  Queue depths: {stats['queue_depth_histogram']}")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
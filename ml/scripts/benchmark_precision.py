@@ -0,0 +1,106 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+import torch
+import torch.nn as nn
+
+# Get absolute paths
+script_dir = os.path.dirname(os.path.abspath(__file__))
+ml_dir = os.path.dirname(script_dir)
+
+sys.path.insert(0, os.path.join(ml_dir, 'training'))
+from inference import build_inference_model, optimize_eager_model
+from precision import autocast_context, to_channels_last
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, default="efficientnet_b1",
+                       choices=["efficientnet_b0", "efficientnet_b1", "efficientnet_b2"])
+    parser.add_argument("--num-classes", type=int, default=12)
+    parser.add_argument("--img-size", type=int, default=224)
+    parser.add_argument("--infer-batch-size", type=int, default=8)
+    parser.add_argument("--train-batch-size", type=int, default=16)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--precisions", type=str, nargs='+', default=["fp32", "bf16"], choices=["fp32", "bf16"])
+    parser.add_argument("--no-compile", action='store_true', help="Skip the torch.compile rows")
+    parser.add_argument("--output", type=str, default=None, help="Also write the matrix as JSON")
+    return parser.parse_args()
+
+def timed(fn, iterations, warmup):
+    """Seconds per call after warm-up (compilation happens during warm-up)"""
+    for _ in range(warmup):
+        fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+def benchmark_config(args, precision, channels_last, compile_model):
+    device = torch.device("cpu")
+    torch.manual_seed(0)
+    
+    # Inference: eval-mode forward, as in predict_batch_fn
+    model = optimize_eager_model(build_inference_model(args.model, args.num_classes).eval(),
+                                 channels_last, compile_model)
+    batch = to_channels_last(torch.randn(args.infer_batch_size, 3, args.img_size, args.img_size), channels_last)
+    def infer():
+        with torch.no_grad(), autocast_context(device, precision):
+            model(batch)
+    infer_seconds = timed(infer, args.iterations, args.warmup)
+    
+    # Training: forward, backward and optimizer step, as in train_epoch
+    model = optimize_eager_model(build_inference_model(args.model, args.num_classes).train(),
+                                 channels_last, compile_model)
+    criterion = nn.CrossEntropyLoss(label_smoothing=0.2)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=3e-4, weight_decay=0.08)
+    images = to_channels_last(torch.randn(args.train_batch_size, 3, args.img_size, args.img_size), channels_last)
+    labels = torch.randint(0, args.num_classes, (args.train_batch_size,))
+    def train_step():
+        optimizer.zero_grad(set_to_none=True)
+        with autocast_context(device, precision):
+            loss = criterion(model(images), labels)
+        loss.backward()
+        optimizer.step()
+    train_seconds = timed(train_step, args.iterations, args.warmup)
+    
+    return {
+        'precision': precision,
+        'channels_last': channels_last,
+        'compile': compile_model,
+        'infer_images_per_sec': args.infer_batch_size / infer_seconds,
+        'infer_batch_latency_ms': infer_seconds * 1000,
+        'train_steps_per_sec': 1 / train_seconds,
+        'train_images_per_sec': args.train_batch_size / train_seconds
+    }
+
+def main():
+    args = parse_args()
+    compile_options = [False] if args.no_compile else [False, True]
+    
+    results = []
+    for precision, channels_last, compile_model in itertools.product(args.precisions, [False, True], compile_options):
+        print(f"Benchmarking {precision}, channels_last={channels_last}, compile={compile_model}...")
+        results.append(benchmark_config(args, precision, channels_last, compile_model))
+    
+    baseline = results[0]
+    print("\n" + "="*78)
+    print(f"CPU, {args.model} @ {args.img_size}px, {torch.get_num_threads()} threads")
+    print(f"{'precision':10s} {'NHWC':>5s} {'compile':>8s} {'infer img/s':>12s} {'speedup':>8s} "
+          f"{'train img/s':>12s} {'speedup':>8s}")
+    for r in results:
+        print(f"{r['precision']:10s} {str(r['channels_last']):>5s} {str(r['compile']):>8s} "
+              f"{r['infer_images_per_sec']:12.1f} {r['infer_images_per_sec'] / baseline['infer_images_per_sec']:7.2f}x "
+              f"{r['train_images_per_sec']:12.1f} {r['train_images_per_sec'] / baseline['train_images_per_sec']:7.2f}x")
+    print("="*78)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
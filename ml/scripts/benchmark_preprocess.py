@@ -0,0 +1,87 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from torch.profiler import ProfilerActivity, profile
+
+# Get absolute paths
+script_dir = os.path.dirname(os.path.abspath(__file__))
+ml_dir = os.path.dirname(script_dir)
+
+sys.path.insert(0, os.path.join(ml_dir, 'training'))
+from inference import TRANSFORM, decode_image
+from preprocess import Preprocessor
+from benchmark_decode import synthetic_photo
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-sizes", type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--channels-last", action='store_true',
+                       help="Preallocate NHWC buffers, as for INFERENCE_CHANNELS_LAST")
+    parser.add_argument("--output", type=str, default=None, help="Also write results as JSON")
+    return parser.parse_args()
+
+def reference_batch(images):
+    """The previous serving path: TRANSFORM per image, then torch.stack"""
+    return torch.stack([TRANSFORM(image) for image in images])
+
+def median_ms(fn, iterations):
+    timings = []
+    for _ in range(iterations + 2):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings[2:]))
+
+def allocated_mb(fn):
+    """Tensor memory allocated by the ops in one call (PIL's own buffers are the same for both paths)"""
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        fn()
+    return sum(max(event.self_cpu_memory_usage, 0) for event in prof.key_averages()) / 2**20
+
+def main():
+    args = parse_args()
+    torch.set_num_threads(1)  # Per-request cost, as one request handler thread sees it
+    preprocessor = Preprocessor(channels_last=args.channels_last)
+    # Decoded the way input_fn does it, from a typical phone photo
+    images = [decode_image(synthetic_photo(1920, 1440, 90)) for _ in range(max(args.batch_sizes))]
+    
+    results = []
+    for batch_size in args.batch_sizes:
+        batch_images = images[:batch_size]
+        expected = reference_batch(batch_images)
+        actual = preprocessor.batch(batch_images)
+        # Warm buffers: steady-state serving never reallocates them
+        reference = lambda: reference_batch(batch_images)
+        fused = lambda: preprocessor.batch(batch_images)
+        results.append({
+            'batch_size': batch_size,
+            'max_abs_diff': float((expected - actual).abs().max()),
+            'reference_ms': median_ms(reference, args.iterations) / batch_size,
+            'fused_ms': median_ms(fused, args.iterations) / batch_size,
+            'reference_alloc_mb': allocated_mb(reference) / batch_size,
+            'fused_alloc_mb': allocated_mb(fused) / batch_size
+        })
+    
+    print("\n" + "="*84)
+    print(f"Preprocessing per image (channels_last={args.channels_last}), {images[0].size[0]}x{images[0].size[1]} decoded")
+    print(f"{'batch':>6s} {'max diff':>9s} {'TRANSFORM ms':>13s} {'fused ms':>9s} {'speedup':>8s} "
+          f"{'TRANSFORM MB':>13s} {'fused MB':>9s}")
+    for r in results:
+        print(f"{r['batch_size']:>6d} {r['max_abs_diff']:>9.1e} {r['reference_ms']:>13.2f} {r['fused_ms']:>9.2f} "
+              f"{r['reference_ms'] / r['fused_ms']:>7.2f}x {r['reference_alloc_mb']:>13.2f} {r['fused_alloc_mb']:>9.2f}")
+    print("="*84)
+    if any(r['max_abs_diff'] > 1e-5 for r in results):
+        print("⚠️  Fused output differs from TRANSFORM beyond float rounding")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.amp import autocast, GradScaler
+from torch.utils.data import DataLoader, TensorDataset
+from torchvision import models
+
+# Get absolute paths
+script_dir = os.path.dirname(os.path.abspath(__file__))
+ml_dir = os.path.dirname(script_dir)
+
+sys.path.insert(0, os.path.join(ml_dir, 'training'))
+from train import train_epoch, mixup_data, cutmix_data, mixup_criterion
+from precision import resolve_precision
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, default="efficientnet_b1",
+                       choices=["efficientnet_b0", "efficientnet_b1", "efficientnet_b2"])
+    parser.add_argument("--img-size", type=int, default=224)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--num-classes", type=int, default=12)
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--warmup-steps", type=int, default=5)
+    parser.add_argument("--mixup-alpha", type=float, default=0.6)
+    parser.add_argument("--cutmix-alpha", type=float, default=1.2)
+    parser.add_argument("--mixup-prob", type=float, default=0.7)
+    parser.add_argument("--clip-grad-norm", type=float, default=1.0)
+    parser.add_argument("--log-every", type=int, default=50)
+    parser.add_argument("--precision", type=str, default="auto", choices=["auto", "fp32", "fp16", "bf16"])
+    parser.add_argument("--channels-last", action='store_true')
+    args = parser.parse_args()
+    args.gpu_augment = False
+    return args
+
+def legacy_train_steps(model, loader, criterion, optimizer, scaler, device, args):
+    """The previous train_epoch body: blocking copies and .item() reads on every step"""
+    model.train()
+    running_loss = 0.0
+    correct = 0
+    total = 0
+    
+    for images, labels in loader:
+        images, labels = images.to(device), labels.to(device)
+        
+        if np.random.rand() < args.mixup_prob:
+            if np.random.rand() < 0.5:
+                images, labels_a, labels_b, lam = mixup_data(images, labels, args.mixup_alpha)
+            else:
+                images, labels_a, labels_b, lam = cutmix_data(images, labels, args.cutmix_alpha)
+            
+            optimizer.zero_grad()
+            with autocast('cuda'):
+                outputs = model(images)
+                loss = mixup_criterion(criterion, outputs, labels_a, labels_b, lam)
+            
+            scaler.scale(loss).backward()
+            scaler.unscale_(optimizer)
+            torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
+            scaler.step(optimizer)
+            scaler.update()
+            
+            running_loss += loss.item()
+            _, predicted = outputs.max(1)
+            total += labels.size(0)
+            correct += (lam * predicted.eq(labels_a).sum().item() +
+                       (1 - lam) * predicted.eq(labels_b).sum().item())
+        else:
+            optimizer.zero_grad()
+            with autocast('cuda'):
+                outputs = model(images)
+                loss = criterion(outputs, labels)
+            
+            scaler.scale(loss).backward()
+            scaler.unscale_(optimizer)
+            torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
+            scaler.step(optimizer)
+            scaler.update()
+            
+            running_loss += loss.item()
+            _, predicted = outputs.max(1)
+            total += labels.size(0)
+            correct += predicted.eq(labels).sum().item()
+    
+    return running_loss / len(loader), 100. * correct / total
+
+def measure(run, loader, device):
+    """Steps/sec for one pass over the loader"""
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    start = time.perf_counter()
+    run(loader)
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    return len(loader) / (time.perf_counter() - start)
+
+def main():
+    args = parse_args()
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    args.precision = resolve_precision(args.precision, device)
+    
+    # Random tensors already in memory, so data loading doesn't hide the per-step syncs
+    images = torch.randn(args.batch_size, 3, args.img_size, args.img_size)
+    labels = torch.randint(0, args.num_classes, (args.batch_size,))
+    def make_loader(steps):
+        dataset = TensorDataset(images.repeat(steps, 1, 1, 1), labels.repeat(steps))
+        return DataLoader(dataset, batch_size=args.batch_size, pin_memory=device.type == "cuda")
+    
+    model = getattr(models, args.model)(num_classes=args.num_classes).to(device)
+    criterion = nn.CrossEntropyLoss(label_smoothing=0.2)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=3e-4, weight_decay=0.08)
+    scaler = GradScaler('cuda')
+    
+    runs = {
+        'Per-step sync': lambda loader: legacy_train_steps(model, loader, criterion, optimizer, scaler, device, args),
+        'train_epoch': lambda loader: train_epoch(model, loader, criterion, optimizer, scaler, device, args, 0),
+    }
+    
+    results = {}
+    for name, run in runs.items():
+        run(make_loader(args.warmup_steps))
+        results[name] = measure(run, make_loader(args.steps), device)
+    
+    print("\n" + "="*40)
+    print(f"Device: {device}, batch {args.batch_size}, {args.steps} steps")
+    for name, steps_per_sec in results.items():
+        print(f"{name:15s} {steps_per_sec:10.2f} steps/sec")
+    print(f"{'Speedup':15s} {results['train_epoch'] / results['Per-step sync']:10.2f}x")
+    print("="*40)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Get absolute paths
+script_dir = os.path.dirname(os.path.abspath(__file__))
+ml_dir = os.path.dirname(script_dir)
+
+sys.path.insert(0, os.path.join(ml_dir, 'training'))
+from worker_pool import WorkerPool, available_cores
+from loadtest_inference import latency_stats, load_request_bodies
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-dir", type=str, default=os.path.join(ml_dir, 'models'))
+    parser.add_argument("--image-dir", type=str, default=os.path.join(ml_dir, 'data', 'processed', 'validation'))
+    parser.add_argument("--samples", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--workers", type=int, nargs='+', default=[2, 4],
+                       help="Pool sizes to compare; threads per worker = cores // workers")
+    parser.add_argument("--concurrency-per-worker", type=int, default=2)
+    parser.add_argument("--output", type=str, default=None, help="Also write results as JSON")
+    return parser.parse_args()
+
+def memory_mb(pid):
+    """(RSS, PSS) of one process in MB; PSS splits shared pages between the processes mapping them"""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    values[key] = int(rest.split()[0]) / 1024
+    except OSError:
+        return None, None
+    return values.get("Rss"), values.get("Pss")
+
+def total_memory(pids):
+    """Summed RSS and PSS; summed RSS counts shared weights once per worker, PSS only once overall"""
+    rss, pss = zip(*(memory_mb(pid) for pid in pids))
+    if None in rss:
+        return None, None
+    return sum(rss), sum(pss)
+
+def benchmark_pool(args, bodies, workers, share_weights):
+    start = time.perf_counter()
+    pool = WorkerPool(args.model_dir, workers=workers, share_weights=share_weights)
+    startup_s = time.perf_counter() - start
+    
+    try:
+        for body in bodies[:workers * 2]:
+            pool.invoke(body)
+        
+        def request(i):
+            start = time.perf_counter()
+            pool.invoke(bodies[i % len(bodies)])
+            return time.perf_counter() - start
+        
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers * args.concurrency_per_worker) as clients:
+            latencies = list(clients.map(request, range(args.requests)))
+        elapsed = time.perf_counter() - start
+        
+        # This process counts too: with shared weights it holds the original copy of the model
+        rss, pss = total_memory([os.getpid()] + pool.pids)
+        return {
+            'mode': "shared" if share_weights else "independent",
+            'workers': workers,
+            'threads_per_worker': pool.threads,
+            'startup_s': startup_s,
+            'images_per_sec': args.requests / elapsed,
+            **latency_stats(latencies),
+            'total_rss_mb': rss,
+            'total_pss_mb': pss
+        }
+    finally:
+        pool.close()
+
+def main():
+    args = parse_args()
+    # Replayed bodies would otherwise be answered from the prediction cache
+    os.environ['INFERENCE_CACHE_SIZE'] = "0"
+    bodies = load_request_bodies(args.image_dir, args.samples)
+    
+    results = []
+    for workers in args.workers:
+        for share_weights in (False, True):
+            print(f"Benchmarking {workers} workers, share_weights={share_weights}...")
+            results.append(benchmark_pool(args, bodies, workers, share_weights))
+    
+    def mb(value):
+        return f"{value:>9.0f}" if value is not None else f"{'n/a':>9s}"
+    
+    print("\n" + "="*92)
+    print(f"Worker pool vs independent model_fn processes ({available_cores()} cores)")
+    print(f"{'mode':12s} {'workers':>7s} {'threads':>7s} {'start s':>8s} {'img/s':>8s} {'p50':>7s} {'p95':>7s} "
+          f"{'RSS MB':>9s} {'PSS MB':>9s}")
+    for r in results:
+        print(f"{r['mode']:12s} {r['workers']:>7d} {r['threads_per_worker']:>7d} {r['startup_s']:>8.1f} "
+              f"{r['images_per_sec']:>8.1f} {r['p50_ms']:>7.1f} {r['p95_ms']:>7.1f} "
+              f"{mb(r['total_rss_mb'])} {mb(r['total_pss_mb'])}")
+    print("="*92)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n📊 Results saved to {args.output}")
+
+if __name__ == '__main__':
+    main()
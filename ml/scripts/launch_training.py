@@ -11,11 +11,14 @@ print(f"Account: {account_id}")
 print(f"Role: {role}")
 sess = sagemaker.Session()
 
+# More than one instance trains with DistributedDataParallel (torchrun on each node)
+instance_count = 1
+
 estimator = PyTorch(
     entry_point="train.py",
     source_dir="training",
     role=role,
-    instance_count=1,
+    instance_count=instance_count,
     instance_type="ml.p3.2xlarge",
     framework_version="2.0",
     py_version="py310",
@@ -27,7 +30,10 @@ estimator = PyTorch(
         "mixup-alpha": 0.7,
         "cutmix-alpha": 1.3,
         "mixup-prob": 0.8,
+        # Synced to checkpoint_s3_uri, so a spot interruption resumes from the last save
+        "checkpoint-dir": "/opt/ml/checkpoints",
     },
+    distribution={"torch_distributed": {"enabled": True}} if instance_count > 1 else None,
     use_spot_instances=True,
     max_wait=7200,
     max_run=3600,
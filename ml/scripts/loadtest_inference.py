@@ -0,0 +1,277 @@
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import torch
+
+# Get absolute paths
+script_dir = os.path.dirname(os.path.abspath(__file__))
+ml_dir = os.path.dirname(script_dir)
+
+sys.path.insert(0, os.path.join(ml_dir, 'training'))
+from inference import (batch_probabilities, format_prediction, model_fn, input_fn, predict_fn, output_fn,
+                       preprocess_batch)
+from benchmark_inference import load_sample_images
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png'}
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-dir", type=str, default=os.path.join(ml_dir, 'models'))
+    parser.add_argument("--image-dir", type=str, default=os.path.join(ml_dir, 'data', 'processed', 'validation'),
+                       help="Validation images to replay (falls back to synthetic JPEGs)")
+    parser.add_argument("--samples", type=int, default=64, help="Distinct images drawn across all breeds")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument("--modes", type=str, nargs='+', default=["inprocess", "http"], choices=["inprocess", "http"])
+    parser.add_argument("--port", type=int, default=0, help="Stand-in server port; 0 picks a free one")
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON")
+    parser.add_argument("--compare", type=str, default=None, help="Earlier results JSON to diff against")
+    return parser.parse_args()
+
+def current_rss_mb():
+    """Resident set size now (Linux), falling back to the peak"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def load_request_bodies(image_dir, count, seed=0):
+    """Raw bytes of validation images sampled across breeds, as clients would upload them"""
+    paths = []
+    if os.path.isdir(image_dir):
+        paths = sorted(p for p in Path(image_dir).rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not paths:
+        return load_sample_images(image_dir, count)
+    paths = random.Random(seed).sample(paths, min(count, len(paths)))
+    return [path.read_bytes() for path in paths]
+
+def latency_stats(seconds):
+    ms = np.array(seconds) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {'mean_ms': float(ms.mean()), 'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99)}
+
+def handle(body, model_dict, content_type='application/x-image'):
+    """The full handler chain SageMaker runs for one request"""
+    return output_fn(predict_fn(input_fn(body, content_type), model_dict))[0]
+
+def stage_breakdown(bodies, model_dict):
+    """Time each step of the handler chain separately, one image at a time"""
+    timings = {name: [] for name in ('decode', 'transform', 'forward', 'topk', 'json')}
+    
+    for body in bodies:
+        start = time.perf_counter()
+        image = input_fn(body, 'application/x-image')
+        timings['decode'].append(time.perf_counter() - start)
+        
+        start = time.perf_counter()
+        batch = preprocess_batch([image], model_dict)
+        timings['transform'].append(time.perf_counter() - start)
+        
+        # Includes the softmax, and the fall-through to the large model when a cascade is configured
+        start = time.perf_counter()
+        probabilities = batch_probabilities(batch, model_dict)
+        timings['forward'].append(time.perf_counter() - start)
+        
+        start = time.perf_counter()
+        prediction = format_prediction(probabilities[0], model_dict['classes'])
+        timings['topk'].append(time.perf_counter() - start)
+        
+        start = time.perf_counter()
+        output_fn(prediction)
+        timings['json'].append(time.perf_counter() - start)
+    
+    return {name: latency_stats(values) for name, values in timings.items()}
+
+def run_load(send, bodies, concurrency, num_requests):
+    """Drive send(body) from concurrent client threads; returns throughput, latency percentiles and failures
+    
+    A failed request is counted by its HTTP status, or by exception name when there is no response
+    (dropped connection, in-process error), instead of aborting the run.
+    """
+    def request(i):
+        start = time.perf_counter()
+        try:
+            send(bodies[i % len(bodies)])
+            status = "200"
+        except urllib.error.HTTPError as e:
+            status = str(e.code)
+        except Exception as e:
+            status = type(e).__name__
+        return time.perf_counter() - start, status
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies, statuses = zip(*pool.map(request, range(num_requests)))
+    elapsed = time.perf_counter() - start
+    errors = sum(status != "200" for status in statuses)
+    
+    return {
+        'concurrency': concurrency,
+        'requests': num_requests,
+        'errors': errors,
+        'statuses': dict(Counter(statuses)),
+        'images_per_sec': (num_requests - errors) / elapsed,
+        **latency_stats(latencies),
+        'rss_mb': current_rss_mb()
+    }
+
+def start_server(model_dict, port=0):
+    """Local stand-in for the SageMaker serving container (/ping and /invocations)"""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        
+        def do_GET(self):
+            self.send_response(200 if self.path == "/ping" else 404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                response = handle(body, model_dict, self.headers.get("Content-Type", "application/x-image")).encode()
+                self.send_response(200)
+            except ValueError as e:
+                response = json.dumps({'error': str(e)}).encode()
+                self.send_response(400)
+            except Exception as e:
+                # As in worker_pool.serve: answer, so the client counts an error rather than a dropped connection
+                response = json.dumps({'error': f"{type(e).__name__}: {e}"}).encode()
+                self.send_response(500)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def http_sender(url):
+    def send(body):
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/x-image"})
+        with urllib.request.urlopen(request) as response:
+            return response.read()
+    return send
+
+def print_comparison(results, baseline):
+    """Relative change of each load-test row against an earlier run"""
+    print(f"\nCompared with {baseline.get('model_version', 'baseline')}:")
+    previous = {(r['mode'], r['concurrency']): r for r in baseline.get('load', [])}
+    for row in results['load']:
+        old = previous.get((row['mode'], row['concurrency']))
+        if old is None:
+            continue
+        print(f"  {row['mode']:9s} c={row['concurrency']:<3d} "
+              f"img/s {100 * (row['images_per_sec'] / old['images_per_sec'] - 1):+6.1f}%  "
+              f"p95 {100 * (row['p95_ms'] / old['p95_ms'] - 1):+6.1f}%  "
+              f"p99 {100 * (row['p99_ms'] / old['p99_ms'] - 1):+6.1f}%")
+
+def main():
+    args = parse_args()
+    # Bodies are replayed many times; a prediction cache would turn the test into cache lookups
+    os.environ['INFERENCE_CACHE_SIZE'] = "0"
+    bodies = load_request_bodies(args.image_dir, args.samples)
+    rss_before = current_rss_mb()
+    
+    # Cold start: model_fn plus the first request, which pays for lazy initialization
+    start = time.perf_counter()
+    model_dict = model_fn(args.model_dir)
+    model_fn_s = time.perf_counter() - start
+    start = time.perf_counter()
+    handle(bodies[0], model_dict)
+    first_request_ms = (time.perf_counter() - start) * 1000
+    
+    # Newest artifact's name and mtime identify the model version being measured
+    artifacts = [p for p in Path(args.model_dir).glob("model*") if p.is_file()]
+    newest = max(artifacts, key=lambda p: p.stat().st_mtime, default=None)
+    results = {
+        'model_dir': args.model_dir,
+        'model_version': f"{newest.name}@{int(newest.stat().st_mtime)}" if newest else "unknown",
+        'backend': os.environ.get("INFERENCE_BACKEND", "eager"),
+        'device': str(model_dict['device']),
+        'torch': torch.__version__,
+        'threads': torch.get_num_threads(),
+        'platform': platform.platform(),
+        'images': {
+            'count': len(bodies),
+            'mean_kb': float(np.mean([len(b) for b in bodies]) / 1024)
+        },
+        'cold_start': {
+            'model_fn_s': model_fn_s,
+            'first_request_ms': first_request_ms,
+            'rss_after_load_mb': current_rss_mb() - rss_before
+        },
+        'stages': stage_breakdown(bodies, model_dict),
+        'load': []
+    }
+    
+    server = None
+    for mode in args.modes:
+        if mode == "http":
+            server = start_server(model_dict, args.port)
+            send = http_sender(f"http://127.0.0.1:{server.server_address[1]}/invocations")
+        else:
+            send = lambda body: handle(body, model_dict)
+        for concurrency in args.concurrency:
+            results['load'].append({'mode': mode, **run_load(send, bodies, concurrency, args.requests)})
+    if server is not None:
+        server.shutdown()
+    results['peak_rss_mb'] = peak_rss_mb()
+    if 'cascade' in model_dict:
+        results['cascade'] = model_dict['cascade'].stats()
+    
+    print("\n" + "="*72)
+    print(f"Model: {results['model_version']} | Backend: {results['backend']} | Device: {results['device']}")
+    print(f"Cold start: model_fn {model_fn_s:.2f}s, first request {first_request_ms:.1f}ms, "
+          f"+{results['cold_start']['rss_after_load_mb']:.0f}MB RSS")
+    print("Stages (mean / p95 ms): " + ", ".join(
+        f"{name} {s['mean_ms']:.1f}/{s['p95_ms']:.1f}" for name, s in results['stages'].items()))
+    print(f"{'mode':9s} {'conc':>5s} {'img/s':>8s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'RSS MB':>8s} {'errors':>7s}")
+    for row in results['load']:
+        print(f"{row['mode']:9s} {row['concurrency']:>5d} {row['images_per_sec']:>8.1f} {row['p50_ms']:>8.1f} "
+              f"{row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['rss_mb']:>8.0f} {row['errors']:>7d}")
+    failures = Counter()
+    for row in results['load']:
+        failures.update({status: count for status, count in row['statuses'].items() if status != "200"})
+    if failures:
+        print("⚠️  Failed requests by status: " + ", ".join(f"{status} x{count}" for status, count in failures.items()))
+    if 'cascade' in results:
+        cascade = results['cascade']
+        saved = f"{cascade['saved_ms_per_request']:.1f}ms" if cascade['saved_ms_per_request'] is not None else "n/a"
+        print(f"Cascade (threshold {cascade['threshold']:.3f}): {100 * cascade['fall_through_rate']:.1f}% fall through, "
+              f"~{saved} saved per request")
+    print("="*72)
+    
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            print_comparison(results, json.load(f))
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n📊 Results saved to {args.output}")
+
+if __name__ == '__main__':
+    main()
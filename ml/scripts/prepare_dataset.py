@@ -1,9 +1,16 @@
 import os
 import shutil
+import argparse
+import hashlib
+import json
+import io
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 from sklearn.model_selection import train_test_split
 import random
 from collections import defaultdict
+from PIL import Image
 
 # Set random seed for reproducibility
 random.seed(42)
@@ -18,6 +25,15 @@ KAGGLE_DIR = RAW_DATA_DIR / "cat_breeds_refined" / "images"
 TRAIN_DIR = PROCESSED_DATA_DIR / "train"
 VAL_DIR = PROCESSED_DATA_DIR / "validation"
 
+# Record of what each destination was copied from, so reruns skip unchanged files
+MANIFEST_FILE = PROCESSED_DATA_DIR / "manifest.json"
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png'}
+
+# Per-file exact/perceptual hashes, reused across runs while size and mtime match
+HASH_INDEX_FILE = PROCESSED_DATA_DIR / "hash_index.json"
+DEDUP_REPORT_FILE = PROCESSED_DATA_DIR / "dedup_report.json"
+
 # Create output directories
 TRAIN_DIR.mkdir(parents=True, exist_ok=True)
 VAL_DIR.mkdir(parents=True, exist_ok=True)
@@ -41,7 +57,7 @@ def collect_images():
     # Process Oxford dataset
     print("Processing Oxford-IIIT Pet Dataset...")
     if OXFORD_DIR.exists():
-        for img_file in OXFORD_DIR.glob("*.jpg"):
+        for img_file in sorted(OXFORD_DIR.glob("*.jpg")):
             # Oxford format: "Abyssinian_100.jpg"
             breed = img_file.stem.rsplit('_', 1)[0]  # Get breed part before last underscore
             
@@ -59,14 +75,169 @@ def collect_images():
                 breed = breed_folder.name
                 normalized_breed = normalize_breed_name(breed)
                 
-                # Get all images from this breed folder
-                images = list(breed_folder.glob("*.jpg")) + list(breed_folder.glob("*.jpeg")) + list(breed_folder.glob("*.png"))
+                # Get all images from this breed folder in one pass (sorted so reruns split identically)
+                images = sorted(f for f in breed_folder.iterdir() if f.suffix in IMAGE_SUFFIXES)
                 breed_images[normalized_breed].extend(images)
         
         print(f"  Found {sum(len(imgs) for imgs in breed_images.values())} total images from Kaggle dataset")
     
     return breed_images
 
+def hash_image(path):
+    """sha256, 64-bit difference hash and a decode check for one file"""
+    stat = path.stat()
+    record = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': None, 'dhash': None, 'error': None}
+    try:
+        data = path.read_bytes()
+        record['sha256'] = hashlib.sha256(data).hexdigest()
+        
+        # verify() catches structural corruption, load() catches truncated pixel data
+        with Image.open(io.BytesIO(data)) as img:
+            img.verify()
+        with Image.open(io.BytesIO(data)) as img:
+            img.draft('L', (64, 64))
+            pixels = img.convert('L').resize((9, 8), Image.BILINEAR).tobytes()
+        
+        # dHash: one bit per horizontal neighbour comparison on a 9x8 thumbnail
+        bits = 0
+        for row in range(8):
+            for col in range(8):
+                bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+        record['dhash'] = f"{bits:016x}"
+    except Exception as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+    return record
+
+def hash_images(paths, workers=8):
+    """Hash every path, reusing the on-disk index for unchanged files"""
+    index = {}
+    if HASH_INDEX_FILE.exists():
+        with open(HASH_INDEX_FILE, 'r') as f:
+            index = json.load(f)
+    
+    pending = []
+    for path in paths:
+        record = index.get(str(path))
+        stat = path.stat()
+        if record is None or record['size'] != stat.st_size or record['mtime'] != stat.st_mtime:
+            pending.append(path)
+    print(f"  {len(paths) - len(pending)} cached, {len(pending)} to hash ({workers} workers)")
+    
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for done, (path, record) in enumerate(zip(pending, pool.map(hash_image, pending, chunksize=32)), 1):
+            index[str(path)] = record
+            if done % 1000 == 0 or done == len(pending):
+                print(f"  [{done}/{len(pending)}] {done / (time.perf_counter() - start):.1f} files/s")
+    
+    HASH_INDEX_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(HASH_INDEX_FILE, 'w') as f:
+        json.dump(index, f)
+    
+    return {str(path): index[str(path)] for path in paths}
+
+def find_near_duplicates(hashes, threshold):
+    """Pairs of indices whose dHashes differ in at most threshold bits"""
+    # Pigeonhole: within threshold bits, at least one of threshold + 1 bands matches exactly
+    num_bands = threshold + 1
+    band_bits = [64 * i // num_bands for i in range(num_bands + 1)]
+    pairs = set()
+    for b in range(num_bands):
+        shift = 64 - band_bits[b + 1]
+        mask = (1 << (band_bits[b + 1] - band_bits[b])) - 1
+        buckets = defaultdict(list)
+        for i, h in enumerate(hashes):
+            buckets[(h >> shift) & mask].append(i)
+        for members in buckets.values():
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    i, j = members[x], members[y]
+                    if (i, j) not in pairs and bin(hashes[i] ^ hashes[j]).count('1') <= threshold:
+                        pairs.add((i, j))
+    return pairs
+
+def deduplicate_images(breed_images, workers=8, near_dup_threshold=4):
+    """Drop undecodable files and exact/near-duplicate photos before splitting"""
+    print("\nChecking for corrupt and duplicate images...")
+    entries = [(breed, path) for breed, images in breed_images.items() for path in images]
+    records = hash_images([path for _, path in entries], workers)
+    
+    report = {'corrupt': [], 'duplicate_groups': []}
+    
+    # Decode check
+    valid = []
+    for breed, path in entries:
+        record = records[str(path)]
+        if record['error']:
+            report['corrupt'].append({'path': str(path), 'error': record['error']})
+        else:
+            valid.append((breed, path))
+    
+    # Union-find over exact (same sha256) and near (close dHash) duplicates
+    parent = list(range(len(valid)))
+    
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    
+    first_by_sha = {}
+    for i, (_, path) in enumerate(valid):
+        sha = records[str(path)]['sha256']
+        if sha in first_by_sha:
+            parent[find(i)] = find(first_by_sha[sha])
+        else:
+            first_by_sha[sha] = i
+    
+    if near_dup_threshold >= 0:
+        dhashes = [int(records[str(path)]['dhash'], 16) for _, path in valid]
+        for i, j in find_near_duplicates(dhashes, near_dup_threshold):
+            parent[find(j)] = find(i)
+    
+    groups = defaultdict(list)
+    for i in range(len(valid)):
+        groups[find(i)].append(i)
+    
+    deduped = defaultdict(list)
+    conflicting = 0
+    for members in groups.values():
+        members.sort()
+        breeds = {valid[i][0] for i in members}
+        if len(members) > 1:
+            report['duplicate_groups'].append({
+                'kept': None if len(breeds) > 1 else str(valid[members[0]][1]),
+                'breeds': sorted(breeds),
+                'paths': [str(valid[i][1]) for i in members]
+            })
+        if len(breeds) > 1:
+            # The same photo labelled as different breeds: no trustworthy label, drop it
+            conflicting += 1
+            continue
+        # Keep the first occurrence (Oxford before Kaggle, then path order)
+        breed, path = valid[members[0]]
+        deduped[breed].append(path)
+    
+    removed = len(valid) - sum(len(images) for images in deduped.values())
+    report['summary'] = {
+        'total': len(entries),
+        'corrupt': len(report['corrupt']),
+        'duplicate_groups': len(report['duplicate_groups']),
+        'conflicting_label_groups': conflicting,
+        'duplicates_removed': removed,
+        'kept': len(entries) - len(report['corrupt']) - removed,
+        'near_dup_threshold': near_dup_threshold
+    }
+    with open(DEDUP_REPORT_FILE, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    print(f"  Corrupt: {len(report['corrupt'])}")
+    print(f"  Duplicate groups: {len(report['duplicate_groups'])} ({conflicting} with conflicting breeds)")
+    print(f"  Removed duplicates: {removed}")
+    print(f"  Report saved to {DEDUP_REPORT_FILE}")
+    
+    return deduped
+
 def filter_breeds(breed_images, min_images=50):
     """Filter out breeds with too few images"""
     print(f"\nFiltering breeds with at least {min_images} images...")
@@ -85,7 +256,102 @@ def filter_breeds(breed_images, min_images=50):
     print(f"\n  Kept {len(filtered)} breeds")
     return filtered
 
-def split_and_copy_images(breed_images, train_ratio=0.8, val_ratio=0.2):
+def file_sha256(path, chunk_size=1 << 20):
+    """Content hash of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_manifest():
+    """Destination -> source record from the previous run"""
+    if MANIFEST_FILE.exists():
+        with open(MANIFEST_FILE, 'r') as f:
+            return json.load(f)
+    return {}
+
+def save_manifest(manifest):
+    tmp_file = MANIFEST_FILE.with_suffix('.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_file, MANIFEST_FILE)
+
+def is_up_to_date(src, dest, record, transcode_max_side=0):
+    """True when dest was already produced from the current contents of src with the same settings"""
+    if record is None or not dest.exists() or record['source'] != str(src):
+        return False
+    # A different --transcode-max-side means a different output; records without one predate it
+    if record.get('transcode_max_side') != transcode_max_side:
+        return False
+    stat = src.stat()
+    if record['size'] == stat.st_size and record['mtime'] == stat.st_mtime:
+        return True
+    # Stat changed (e.g. touched or re-downloaded): only the content hash decides
+    return record['sha256'] == file_sha256(src)
+
+def copy_image(src, dest, transcode_max_side=0, chunk_size=1 << 20):
+    """Copy one image (or re-encode it as a downscaled JPEG) and return its manifest record"""
+    stat = src.stat()
+    if transcode_max_side:
+        with Image.open(src) as img:
+            img = img.convert('RGB')
+            img.thumbnail((transcode_max_side, transcode_max_side))
+            img.save(dest, format='JPEG', quality=95)
+        sha256 = file_sha256(src)
+    else:
+        # Hash while copying so every source is read only once
+        digest = hashlib.sha256()
+        with open(src, 'rb') as fsrc, open(dest, 'wb') as fdest:
+            for chunk in iter(lambda: fsrc.read(chunk_size), b''):
+                digest.update(chunk)
+                fdest.write(chunk)
+        shutil.copystat(src, dest)
+        sha256 = digest.hexdigest()
+    
+    return {
+        'source': str(src),
+        'sha256': sha256,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'transcode_max_side': transcode_max_side
+    }
+
+def copy_images(jobs, workers=8, transcode_max_side=0, progress_every=500):
+    """Copy (src, dest) pairs in parallel, skipping destinations that are up to date"""
+    manifest = load_manifest()
+    planned = {str(dest) for _, dest in jobs}
+    
+    # Drop destinations from earlier runs that are no longer part of the split
+    for dest in list(manifest):
+        if dest not in planned:
+            Path(dest).unlink(missing_ok=True)
+            del manifest[dest]
+    
+    pending = [(src, dest) for src, dest in jobs
+               if not is_up_to_date(src, dest, manifest.get(str(dest)), transcode_max_side)]
+    print(f"  {len(jobs) - len(pending)} up to date, {len(pending)} to copy ({workers} workers)")
+    
+    start = time.perf_counter()
+    copied_bytes = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(copy_image, src, dest, transcode_max_side): dest for src, dest in pending}
+        for done, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            manifest[str(futures[future])] = record
+            copied_bytes += record['size']
+            
+            if done % progress_every == 0 or done == len(pending):
+                elapsed = time.perf_counter() - start
+                print(f"  [{done}/{len(pending)}] {done / elapsed:.1f} files/s, "
+                      f"{copied_bytes / elapsed / 2**20:.1f} MB/s")
+                # Checkpoint progress so an interrupted run resumes from here
+                save_manifest(manifest)
+    
+    save_manifest(manifest)
+    return len(pending)
+
+def split_and_copy_images(breed_images, train_ratio=0.8, val_ratio=0.2, workers=8, transcode_max_side=0):
     """Split images into train/val and copy to appropriate directories"""
     print(f"\nSplitting dataset (train: {train_ratio*100}%, val: {val_ratio*100}%)...")
     
@@ -95,6 +361,7 @@ def split_and_copy_images(breed_images, train_ratio=0.8, val_ratio=0.2):
         'val_images': 0,
         'breeds': len(breed_images)
     }
+    jobs = []
     
     for breed, images in sorted(breed_images.items()):
         # Split images
@@ -111,15 +378,15 @@ def split_and_copy_images(breed_images, train_ratio=0.8, val_ratio=0.2):
         train_breed_dir.mkdir(exist_ok=True)
         val_breed_dir.mkdir(exist_ok=True)
         
-        # Copy training images
+        # Queue training images (transcoded files are always JPEG)
         for idx, img_path in enumerate(train_imgs):
-            dest = train_breed_dir / f"{breed}_{idx:04d}{img_path.suffix}"
-            shutil.copy2(img_path, dest)
+            suffix = ".jpg" if transcode_max_side else img_path.suffix
+            jobs.append((img_path, train_breed_dir / f"{breed}_{idx:04d}{suffix}"))
         
-        # Copy validation images
+        # Queue validation images
         for idx, img_path in enumerate(val_imgs):
-            dest = val_breed_dir / f"{breed}_val_{idx:04d}{img_path.suffix}"
-            shutil.copy2(img_path, dest)
+            suffix = ".jpg" if transcode_max_side else img_path.suffix
+            jobs.append((img_path, val_breed_dir / f"{breed}_val_{idx:04d}{suffix}"))
         
         stats['total_images'] += len(images)
         stats['train_images'] += len(train_imgs)
@@ -127,6 +394,9 @@ def split_and_copy_images(breed_images, train_ratio=0.8, val_ratio=0.2):
         
         print(f"  {breed}: {len(images)} total ({len(train_imgs)} train, {len(val_imgs)} val)")
     
+    print(f"\nCopying {len(jobs)} images...")
+    stats['copied_images'] = copy_images(jobs, workers, transcode_max_side)
+    
     return stats
 
 def save_breed_mapping(breed_images):
@@ -142,7 +412,19 @@ def save_breed_mapping(breed_images):
     print(f"\nBreed mapping saved to {mapping_file}")
     return breed_to_idx
 
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=min(32, (os.cpu_count() or 1) * 4),
+                       help="Parallel copy threads")
+    parser.add_argument("--transcode-max-side", type=int, default=0,
+                       help="Re-encode as JPEG with the longest side capped at this size (0 copies as-is)")
+    parser.add_argument("--near-dup-threshold", type=int, default=4,
+                       help="Max dHash bit distance treated as the same photo (-1 keeps near-duplicates)")
+    parser.add_argument("--skip-dedup", action='store_true', help="Skip the corrupt/duplicate image check")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
     print("=" * 60)
     print("Cat Breed Dataset Preparation")
     print("=" * 60)
@@ -158,13 +440,18 @@ def main():
     print(f"  Total breeds: {len(breed_images)}")
     print(f"  Total images: {sum(len(imgs) for imgs in breed_images.values())}")
     
-    # Step 2: Filter breeds with insufficient images
+    # Step 2: Drop corrupt files and duplicates so no photo lands in both splits
+    if not args.skip_dedup:
+        breed_images = deduplicate_images(breed_images, args.workers, args.near_dup_threshold)
+    
+    # Step 3: Filter breeds with insufficient images
     breed_images = filter_breeds(breed_images, min_images=50)
     
-    # Step 3: Split and copy images
-    stats = split_and_copy_images(breed_images, train_ratio=0.8, val_ratio=0.2)
+    # Step 4: Split and copy images
+    stats = split_and_copy_images(breed_images, train_ratio=0.8, val_ratio=0.2,
+                                  workers=args.workers, transcode_max_side=args.transcode_max_side)
     
-    # Step 4: Save breed mapping
+    # Step 5: Save breed mapping
     breed_to_idx = save_breed_mapping(breed_images)
     
     # Print final statistics
@@ -175,6 +462,7 @@ def main():
     print(f"Total images: {stats['total_images']}")
     print(f"Training images: {stats['train_images']}")
     print(f"Validation images: {stats['val_images']}")
+    print(f"Copied this run: {stats['copied_images']}")
     print(f"\nDataset saved to:")
     print(f"  Train: {TRAIN_DIR}")
     print(f"  Validation: {VAL_DIR}")
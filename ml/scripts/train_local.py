@@ -34,6 +34,8 @@ print(f"✅ Training data found: {train_path}")
 print(f"✅ Validation data found: {val_path}")
 
 # Import training script
+# Resumable run: pass --checkpoint-dir ml/checkpoints; rerunning picks up from the latest save
+# Multi-process on CPU: torchrun --nproc_per_node=2 ml/scripts/train_local.py --dist-backend gloo
 sys.path.insert(0, os.path.join(ml_dir, 'training'))
 from train import main
 
@@ -0,0 +1,198 @@
+import argparse
+import glob
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, TensorDataset
+
+# Get absolute paths
+script_dir = os.path.dirname(os.path.abspath(__file__))
+ml_dir = os.path.dirname(script_dir)
+
+sys.path.insert(0, os.path.join(ml_dir, 'training'))
+from train import train_epoch
+from precision import make_grad_scaler
+from checkpoint import (CHECKPOINT_PATTERN, AsyncCheckpointer, ResumableSampler, checkpoint_path,
+                        get_rng_state, load_latest_checkpoint, set_rng_state)
+
+# Interrupted in the second epoch, after the first one finished with no improvement
+EPOCH = 1
+NUM_SAMPLES = 96
+BATCH_SIZE = 8
+KEEP = 2
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Interrupt a small training run mid-epoch and resume it in a new process")
+    parser.add_argument("--checkpoint-dir", type=str, default=None, help="Default: a fresh temp directory")
+    parser.add_argument("--interrupt-at", type=int, default=5, help="Optimizer step of the last save before the interruption")
+    parser.add_argument("--phase", type=str, default=None, choices=["interrupt", "resume"], help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def build_run(model_seed=0):
+    """Tiny stand-in for train.py's main(): same state objects, same sampler, same train_epoch"""
+    torch.manual_seed(model_seed)
+    model = nn.Sequential(nn.Conv2d(3, 8, 3), nn.AdaptiveAvgPool2d(1), nn.Flatten(), nn.Linear(8, 4))
+    optimizer = torch.optim.AdamW(model.parameters(), lr=0.01, weight_decay=0.08)
+    scheduler_warmup = torch.optim.lr_scheduler.LinearLR(optimizer, start_factor=0.1, total_iters=3)
+    scheduler_cosine = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=5, eta_min=1e-6)
+    scaler = make_grad_scaler(torch.device("cpu"), "fp32")
+    
+    generator = torch.Generator().manual_seed(0)
+    dataset = TensorDataset(torch.randn(NUM_SAMPLES, 3, 16, 16, generator=generator),
+                            torch.randint(0, 4, (NUM_SAMPLES,), generator=generator))
+    sampler = ResumableSampler(dataset, num_replicas=1, rank=0, shuffle=True)
+    loader = DataLoader(dataset, batch_size=BATCH_SIZE, sampler=sampler, drop_last=True)
+    return model, optimizer, scheduler_warmup, scheduler_cosine, scaler, loader
+
+def train_args():
+    return SimpleNamespace(mixup_prob=0.5, mixup_alpha=0.6, cutmix_alpha=1.2, gpu_augment=False,
+                           channels_last=False, precision="fp32", clip_grad_norm=1.0, log_every=0)
+
+def assert_same(expected, actual, name):
+    """Recursive equality over nested state dicts, tensors, arrays and RNG states"""
+    if torch.is_tensor(expected):
+        assert torch.equal(expected, actual), f"{name} differs"
+    elif isinstance(expected, np.ndarray):
+        assert np.array_equal(expected, actual), f"{name} differs"
+    elif isinstance(expected, dict):
+        assert expected.keys() == actual.keys(), f"{name} keys differ: {sorted(expected)} vs {sorted(actual)}"
+        for key in expected:
+            assert_same(expected[key], actual[key], f"{name}.{key}")
+    elif isinstance(expected, (list, tuple)):
+        assert len(expected) == len(actual), f"{name} length differs"
+        for i, (e, a) in enumerate(zip(expected, actual)):
+            assert_same(e, a, f"{name}[{i}]")
+    else:
+        assert expected == actual, f"{name}: expected {expected!r}, got {actual!r}"
+
+def random_draws():
+    """Next values from every generator train_epoch consumes"""
+    return {'python': random.random(), 'numpy': np.random.rand(3), 'torch': torch.rand(3)}
+
+def interrupt(args):
+    """First process: train part of an epoch, checkpointing every step, then die mid-epoch"""
+    model, optimizer, scheduler_warmup, scheduler_cosine, scaler, loader = build_run()
+    scheduler_warmup.step()
+    history = {'train_loss': [1.4], 'train_acc': [30.0], 'val_loss': [1.3], 'val_acc': [25.0]}
+    best_acc, best_epoch, patience_counter = 25.0, 0, 1
+    checkpointer = AsyncCheckpointer(args.checkpoint_dir, keep=KEEP)
+    assert not os.listdir(args.checkpoint_dir), f"{args.checkpoint_dir} is not empty"
+    expected = {}
+    
+    def training_state(epoch, step, epoch_progress):
+        return {
+            'epoch': epoch,
+            'step': step,
+            'epoch_progress': epoch_progress,
+            'model_state_dict': model.state_dict(),
+            'optimizer_state_dict': optimizer.state_dict(),
+            'scaler_state_dict': scaler.state_dict(),
+            'scheduler_warmup_state_dict': scheduler_warmup.state_dict(),
+            'scheduler_cosine_state_dict': scheduler_cosine.state_dict(),
+            'rng_state': get_rng_state(),
+            'best_acc': best_acc,
+            'best_epoch': best_epoch,
+            'patience_counter': patience_counter,
+            'history': history,
+        }
+    
+    def on_step(progress):
+        checkpointer.save(training_state(EPOCH, progress['step'], progress), EPOCH, progress['step'])
+        if progress['step'] == args.interrupt_at:
+            # What this process would have drawn next, for the resumed process to reproduce
+            expected['draws'] = random_draws()
+            expected['total'] = progress['total']
+            raise KeyboardInterrupt
+    
+    loader.sampler.set_epoch(EPOCH)
+    expected['order'] = list(loader.sampler)
+    try:
+        train_epoch(model, loader, nn.CrossEntropyLoss(), optimizer, scaler, torch.device("cpu"),
+                    train_args(), EPOCH, on_step=on_step)
+        raise AssertionError("Epoch finished before the interruption")
+    except KeyboardInterrupt:
+        pass
+    # save() only snapshots; the last write may still be running on the checkpointer's thread
+    checkpointer.wait()
+    
+    paths = sorted(glob.glob(os.path.join(args.checkpoint_dir, CHECKPOINT_PATTERN)))
+    assert paths == [checkpoint_path(args.checkpoint_dir, EPOCH, step)
+                     for step in range(args.interrupt_at - KEEP + 1, args.interrupt_at + 1)], \
+        f"Pruning kept {paths}"
+    assert not glob.glob(os.path.join(args.checkpoint_dir, "*.tmp")), "Temporary checkpoint left behind"
+    
+    # A save torn by the interruption, newer than every good one; resume must fall back past it
+    with open(checkpoint_path(args.checkpoint_dir, EPOCH, args.interrupt_at + 1), 'wb') as f:
+        f.write(b"PK\x03\x04 truncated")
+    torch.save(expected, os.path.join(args.checkpoint_dir, "expected.pt"))
+    print(f"💾 Interrupted at epoch {EPOCH + 1}, step {args.interrupt_at}; kept {[os.path.basename(p) for p in paths]}")
+
+def resume(args):
+    """Second process: restore everything the way train.py's main() does and compare"""
+    expected = torch.load(os.path.join(args.checkpoint_dir, "expected.pt"), weights_only=False)
+    state = load_latest_checkpoint(args.checkpoint_dir)
+    assert state is not None, "No checkpoint loaded"
+    assert (state['epoch'], state['step']) == (EPOCH, args.interrupt_at), \
+        f"Resumed at epoch {state['epoch']}, step {state['step']}; expected {EPOCH}, {args.interrupt_at}"
+    assert state['epoch_progress']['total'] == expected['total'] == args.interrupt_at * BATCH_SIZE
+    
+    model, optimizer, scheduler_warmup, scheduler_cosine, scaler, loader = build_run(model_seed=1)
+    model.load_state_dict(state['model_state_dict'])
+    optimizer.load_state_dict(state['optimizer_state_dict'])
+    scaler.load_state_dict(state['scaler_state_dict'])
+    scheduler_warmup.load_state_dict(state['scheduler_warmup_state_dict'])
+    scheduler_cosine.load_state_dict(state['scheduler_cosine_state_dict'])
+    set_rng_state(state['rng_state'])
+    
+    assert_same(state['model_state_dict'], model.state_dict(), "model")
+    assert_same(state['optimizer_state_dict'], optimizer.state_dict(), "optimizer")
+    assert_same(state['scaler_state_dict'], scaler.state_dict(), "scaler")
+    assert_same(state['scheduler_warmup_state_dict'], scheduler_warmup.state_dict(), "scheduler_warmup")
+    assert_same(state['scheduler_cosine_state_dict'], scheduler_cosine.state_dict(), "scheduler_cosine")
+    assert_same((25.0, 0, 1), (state['best_acc'], state['best_epoch'], state['patience_counter']), "early stopping")
+    assert_same([1.4], state['history']['train_loss'], "history")
+    
+    # Same seed and epoch give the same order; the consumed prefix is skipped
+    loader.sampler.set_epoch(EPOCH)
+    loader.sampler.skip(state['epoch_progress']['total'])
+    remaining = list(loader.sampler)
+    assert remaining == expected['order'][expected['total']:], "Sampler did not skip exactly the consumed samples"
+    assert len(loader) == (NUM_SAMPLES - expected['total']) // BATCH_SIZE
+    
+    # RNG restored to the instant of the save: the next draws match the interrupted process
+    rng_state = get_rng_state()
+    assert_same(expected['draws'], random_draws(), "rng draws")
+    set_rng_state(rng_state)
+    
+    steps = []
+    train_epoch(model, loader, nn.CrossEntropyLoss(), optimizer, scaler, torch.device("cpu"), train_args(), EPOCH,
+                progress=state['epoch_progress'], on_step=lambda progress: steps.append(progress['step']))
+    assert steps == list(range(args.interrupt_at + 1, NUM_SAMPLES // BATCH_SIZE + 1)), f"Resumed steps {steps}"
+    print(f"♻️  Resumed at epoch {EPOCH + 1}, step {args.interrupt_at}, skipped {expected['total']} samples, "
+          f"finished the epoch at step {steps[-1]}")
+
+def main():
+    args = parse_args()
+    if args.phase == "interrupt":
+        return interrupt(args)
+    if args.phase == "resume":
+        return resume(args)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        args.checkpoint_dir = args.checkpoint_dir or os.path.join(tmp, "checkpoints")
+        for phase in ("interrupt", "resume"):
+            # Separate interpreters, as after a spot interruption: nothing survives but the files
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--phase", phase,
+                            "--checkpoint-dir", args.checkpoint_dir, "--interrupt-at", str(args.interrupt_at)],
+                           check=True)
+    print("✅ Resume verified: position, sampler skip, model/optimizer/scaler/scheduler/RNG/early-stopping state")
+
+if __name__ == '__main__':
+    main()
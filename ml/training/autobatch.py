@@ -0,0 +1,72 @@
+import torch
+import torch.distributed as dist
+
+from precision import autocast_context
+
+def _fits(model, criterion, device, batch_size, img_size, num_classes, precision):
+    """One forward/backward pass at this micro-batch size without running out of memory"""
+    images = torch.randn(batch_size, 3, img_size, img_size, device=device)
+    labels = torch.randint(0, num_classes, (batch_size,), device=device)
+    try:
+        with autocast_context(device, precision):
+            loss = criterion(model(images), labels)
+        loss.backward()
+        return True
+    except torch.cuda.OutOfMemoryError:
+        return False
+    finally:
+        model.zero_grad(set_to_none=True)
+        del images, labels
+        torch.cuda.empty_cache()
+
+def find_max_batch_size(model, criterion, device, img_size, num_classes, max_batch, margin=0.9, multiple=8,
+                        precision='fp16'):
+    """Largest training micro-batch (<= max_batch) that fits on the GPU at this image size
+    
+    Probes by doubling, then bisects between the last size that fit and the first that didn't.
+    The result is shrunk by margin and rounded down to a multiple of `multiple` to leave headroom
+    for mixup/cutmix and allocator fragmentation. Pass the unwrapped model, not the DDP wrapper:
+    under DDP every rank probes independently and they agree on the smallest result.
+    """
+    if device.type != "cuda":
+        print("Auto batch size needs a CUDA device; using the full batch")
+        return max_batch
+    
+    # Forward passes in train mode update BatchNorm running stats; restore them afterwards
+    state = {k: v.detach().to("cpu", copy=True) for k, v in model.state_dict().items()}
+    model.train()
+    
+    good, bad = 0, None
+    size = min(multiple, max_batch)
+    while size <= max_batch:
+        if not _fits(model, criterion, device, size, img_size, num_classes, precision):
+            bad = size
+            break
+        good = size
+        if size == max_batch:
+            break
+        size = min(size * 2, max_batch)
+    
+    if bad is not None:
+        while bad - good > 1:
+            mid = (good + bad) // 2
+            if _fits(model, criterion, device, mid, img_size, num_classes, precision):
+                good = mid
+            else:
+                bad = mid
+    
+    model.load_state_dict(state)
+    
+    if good == max_batch:
+        best = max_batch
+    else:
+        best = int(good * margin) // multiple * multiple or int(good * margin)
+    
+    if dist.is_initialized():
+        tensor = torch.tensor([best], device=device)
+        dist.all_reduce(tensor, op=dist.ReduceOp.MIN)
+        best = int(tensor.item())
+    
+    if best < 1:
+        raise RuntimeError(f"Not even one {img_size}px image fits in GPU memory")
+    return best
@@ -0,0 +1,126 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+def bucket(value):
+    """Round up to the next power of two for histogram buckets"""
+    size = 1
+    while size < value:
+        size *= 2
+    return size
+
+class MicroBatcher:
+    """Collect concurrent single-image requests into batched forward passes"""
+    
+    def __init__(self, batch_fn, max_batch_size=8, max_wait_ms=5.0):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._queue_depths = Counter()
+        self._closed = False
+        
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+    
+    def submit(self, item):
+        """Queue one item and return a Future resolving to its result"""
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        future = Future()
+        self._queue.put((item, future))
+        return future
+    
+    def predict(self, item, timeout=None):
+        """Blocking helper: submit and wait for the result"""
+        return self.submit(item).result(timeout)
+    
+    def close(self):
+        """Stop the worker after draining requests already queued"""
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+    
+    def stats(self):
+        """Batch-size and queue-depth histograms for latency/throughput tuning"""
+        with self._stats_lock:
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'batches': sum(self._batch_sizes.values()),
+                'requests': sum(size * count for size, count in self._batch_sizes.items()),
+                'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+                'queue_depth_histogram': dict(sorted(self._queue_depths.items()))
+            }
+    
+    def _collect(self):
+        """Block for the first request, then gather more until full or timed out"""
+        first = self._queue.get()
+        if first is None:
+            return None
+        
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # Re-queue the sentinel so the loop exits after this batch
+                self._queue.put(None)
+                break
+            batch.append(request)
+        
+        return batch
+    
+    def _run(self):
+        batch = []
+        try:
+            while True:
+                batch = self._collect()
+                if batch is None:
+                    return
+                # Depth includes the batch being formed plus whatever is still waiting
+                depth = len(batch) + self._queue.qsize()
+                
+                with self._stats_lock:
+                    self._batch_sizes[len(batch)] += 1
+                    self._queue_depths[bucket(depth)] += 1
+                
+                items = [item for item, _ in batch]
+                try:
+                    results = self.batch_fn(items)
+                except Exception as e:
+                    for _, future in batch:
+                        future.set_exception(e)
+                    continue
+                
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+        except BaseException as e:
+            # KeyboardInterrupt/SystemExit end the worker; fail every waiter instead of leaving it blocked
+            self._closed = True
+            self._fail_pending(batch or [], RuntimeError(f"MicroBatcher worker stopped: {type(e).__name__}"))
+            raise
+    
+    def _fail_pending(self, batch, error):
+        """Set error on the in-flight batch and everything still queued"""
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if request is not None:
+                request[1].set_exception(error)
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DISK_TIMEOUT_SECONDS = 30
+
+def content_hash(data):
+    """Stable key for raw request bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+class PredictionCache:
+    """Bounded LRU cache of prediction dicts keyed by request content hash"""
+    
+    def __init__(self, max_entries=1024, ttl_seconds=3600, disk_path=None,
+                 max_disk_entries=100000, namespace=""):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        # Keys are namespaced by model version so a redeploy never serves stale results
+        self.namespace = namespace
+        
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        
+        # Optional sqlite tier so the cache survives worker restarts
+        self._db = None
+        self._disk_writes = 0
+        if disk_path:
+            # Shared by every pool worker: WAL lets readers run alongside the one writer,
+            # and the timeout waits out another worker's write instead of raising "database is locked"
+            self._db = sqlite3.connect(disk_path, timeout=DISK_TIMEOUT_SECONDS, check_same_thread=False)
+            self._db.execute(f"PRAGMA busy_timeout = {int(DISK_TIMEOUT_SECONDS * 1000)}")
+            self._db.execute("PRAGMA journal_mode = WAL")
+            # A lost last write after a power cut only costs a cache miss
+            self._db.execute("PRAGMA synchronous = NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.commit()
+    
+    def _key(self, digest):
+        return f"{self.namespace}:{digest}"
+    
+    def _expired(self, created):
+        return self.ttl_seconds is not None and time.time() - created > self.ttl_seconds
+    
+    def get(self, digest):
+        """Return a cached prediction or None"""
+        key = self._key(digest)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created = entry
+                if not self._expired(created):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created FROM predictions WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[1]):
+                    value = json.loads(row[0])
+                    self._insert(key, value, row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+            
+            self.misses += 1
+            return None
+    
+    def put(self, digest, value):
+        """Store a prediction in memory and, if enabled, on disk"""
+        key = self._key(digest)
+        created = time.time()
+        with self._lock:
+            self._insert(key, value, created)
+            
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO predictions (key, value, created) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), created)
+                )
+                self._disk_writes += 1
+                # Prune occasionally rather than on every write
+                if self._disk_writes % 100 == 0:
+                    self._prune_disk()
+                self._db.commit()
+    
+    def _insert(self, key, value, created):
+        self._entries[key] = (value, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def _prune_disk(self):
+        if self.ttl_seconds is not None:
+            self._db.execute("DELETE FROM predictions WHERE created < ?",
+                             (time.time() - self.ttl_seconds,))
+        self._db.execute(
+            "DELETE FROM predictions WHERE key NOT IN "
+            "(SELECT key FROM predictions ORDER BY created DESC LIMIT ?)",
+            (self.max_disk_entries,)
+        )
+    
+    def stats(self):
+        """Hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
\ No newline at end of file
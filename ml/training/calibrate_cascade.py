@@ -0,0 +1,100 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import torch
+from torchvision import datasets
+
+from cascade import CASCADE_FILE, pick_threshold
+from inference import TRANSFORM, load_classes, load_eager_model
+from quantize import measure_latency, sample_loader
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-dir", type=str, default=os.environ.get("SM_MODEL_DIR", "./model"),
+                       help="Large model; cascade.json is written here")
+    parser.add_argument("--fast-model-dir", type=str, required=True, help="Small model answering first")
+    parser.add_argument("--validation", type=str, default=os.environ.get("SM_CHANNEL_VALIDATION", "./data/validation"))
+    parser.add_argument("--target-accuracy", type=float, default=None,
+                       help="Top-1 %% the cascade must keep (default: the large model's own accuracy)")
+    parser.add_argument("--eval-samples", type=int, default=0, help="0 evaluates the full validation set")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--num-workers", type=int, default=4)
+    return parser.parse_args()
+
+def collect_predictions(model, loader):
+    """Softmax probabilities and labels over the whole loader"""
+    probabilities, labels = [], []
+    with torch.no_grad():
+        for images, targets in loader:
+            probabilities.append(torch.nn.functional.softmax(model(images), dim=1))
+            labels.append(targets)
+    return torch.cat(probabilities).numpy(), torch.cat(labels).numpy()
+
+def main():
+    args = parse_args()
+    # Calibrated on CPU like the serving fleet, so the latency numbers are the ones that matter
+    device = torch.device("cpu")
+    classes = load_classes(args.model_dir)
+    if load_classes(args.fast_model_dir) != classes:
+        raise ValueError("Fast and large models were trained on different classes")
+    large = load_eager_model(args.model_dir, len(classes), device)
+    fast = load_eager_model(args.fast_model_dir, len(classes), device)
+    
+    loader = sample_loader(datasets.ImageFolder(args.validation, transform=TRANSFORM),
+                           args.eval_samples, args.batch_size, args.num_workers)
+    print("Scoring the validation set with both models...")
+    fast_probabilities, labels = collect_predictions(fast, loader)
+    large_probabilities, _ = collect_predictions(large, loader)
+    
+    confidence = fast_probabilities.max(axis=1)
+    fast_correct = fast_probabilities.argmax(axis=1) == labels
+    large_correct = large_probabilities.argmax(axis=1) == labels
+    large_accuracy = 100. * large_correct.mean()
+    target = large_accuracy if args.target_accuracy is None else args.target_accuracy
+    
+    choice = pick_threshold(confidence, fast_correct, large_correct, target)
+    fast_ms = measure_latency(fast)
+    large_ms = measure_latency(large)
+    # Expected batch-1 cost: every request runs the fast model, fall-throughs the large one too
+    cascade_ms = fast_ms + choice['fall_through_rate'] * large_ms
+    
+    report = {
+        'threshold': choice['threshold'],
+        'target_accuracy': target,
+        'accuracy': choice['accuracy'],
+        'fall_through_rate': choice['fall_through_rate'],
+        'fast_accuracy': float(100. * fast_correct.mean()),
+        'large_accuracy': float(large_accuracy),
+        'fast_ms': fast_ms,
+        'large_ms': large_ms,
+        'cascade_ms': cascade_ms,
+        'saved_ms': large_ms - cascade_ms,
+        'eval_samples': len(labels),
+        'fast_model_dir': os.path.abspath(args.fast_model_dir)
+    }
+    
+    print("\n" + "="*60)
+    print(f"{'threshold':>10s} {'accuracy':>9s} {'fall-through':>13s} {'est. ms':>8s}")
+    for threshold in (0.5, 0.7, 0.8, 0.9, 0.95, 0.99, choice['threshold']):
+        exits = confidence >= threshold
+        accuracy = 100. * np.where(exits, fast_correct, large_correct).mean()
+        marker = "  <- picked" if threshold == choice['threshold'] else ""
+        print(f"{threshold:>10.3f} {accuracy:>8.2f}% {100 * (1 - exits.mean()):>12.1f}% "
+              f"{fast_ms + (1 - exits.mean()) * large_ms:>8.1f}{marker}")
+    print("="*60)
+    print(f"Large model alone: {large_accuracy:.2f}% at {large_ms:.1f}ms; fast model alone: "
+          f"{report['fast_accuracy']:.2f}% at {fast_ms:.1f}ms")
+    if choice['accuracy'] < target:
+        print(f"⚠️  Even the large model alone misses the {target:.2f}% target; every request falls through")
+    print(f"Cascade: {choice['accuracy']:.2f}% with {100 * choice['fall_through_rate']:.1f}% falling through, "
+          f"~{report['saved_ms']:.1f}ms saved per request")
+    
+    path = os.path.join(args.model_dir, CASCADE_FILE)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Threshold saved to {path} (used by model_fn unless INFERENCE_CASCADE_THRESHOLD is set)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# Written next to the large model by calibrate_cascade.py
+CASCADE_FILE = 'cascade.json'
+DEFAULT_THRESHOLD = 0.9
+
+def load_threshold(model_dir):
+    """Calibrated threshold from cascade.json, or the default when none was picked"""
+    path = os.path.join(model_dir, CASCADE_FILE)
+    if not os.path.exists(path):
+        return DEFAULT_THRESHOLD
+    with open(path, 'r') as f:
+        return json.load(f)['threshold']
+
+def run_cascade(fast_fn, large_fn, batch, threshold, stats=None):
+    """Class probabilities from the fast model, with unsure rows recomputed by the large one
+    
+    fast_fn and large_fn map a batch to softmax probabilities. Returns them on the CPU.
+    """
+    start = time.perf_counter()
+    probabilities = fast_fn(batch).cpu()
+    unsure = (probabilities.max(dim=1).values < threshold).nonzero().flatten()
+    fast_seconds = time.perf_counter() - start
+    
+    large_seconds = 0.0
+    if len(unsure):
+        start = time.perf_counter()
+        probabilities[unsure] = large_fn(batch[unsure.to(batch.device)]).cpu()
+        large_seconds = time.perf_counter() - start
+    
+    if stats is not None:
+        stats.record(len(batch), len(unsure), fast_seconds, large_seconds)
+    return probabilities
+
+class CascadeStats:
+    """Fall-through rate and time saved by answering confident requests from the fast model"""
+    
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._fall_throughs = 0
+        self._fast_seconds = 0.0
+        self._large_seconds = 0.0
+    
+    def record(self, requests, fall_throughs, fast_seconds, large_seconds):
+        with self._lock:
+            self._requests += requests
+            self._fall_throughs += fall_throughs
+            self._fast_seconds += fast_seconds
+            self._large_seconds += large_seconds
+    
+    def stats(self):
+        """Per-image costs are averaged over batched calls, so savings are an estimate"""
+        with self._lock:
+            requests, fall_throughs = self._requests, self._fall_throughs
+            fast_seconds, large_seconds = self._fast_seconds, self._large_seconds
+        fast_ms = 1000 * fast_seconds / requests if requests else 0.0
+        large_ms = 1000 * large_seconds / fall_throughs if fall_throughs else None
+        saved_ms = None
+        if large_ms is not None:
+            # Every fast exit skips one large-model image; every request pays for the fast model
+            saved_ms = (requests - fall_throughs) / requests * large_ms - fast_ms
+        return {
+            'threshold': self.threshold,
+            'requests': requests,
+            'fall_throughs': fall_throughs,
+            'fall_through_rate': fall_throughs / requests if requests else 0.0,
+            'fast_ms_per_image': fast_ms,
+            'large_ms_per_image': large_ms,
+            'saved_ms_per_request': saved_ms
+        }
+
+def pick_threshold(confidence, fast_correct, large_correct, target_accuracy):
+    """Lowest threshold whose cascade accuracy (in percent) stays at or above the target
+    
+    Sorting by fast-model confidence, the k most confident images exit early and the rest fall
+    through, so every candidate threshold is scored in one cumulative sum.
+    """
+    order = np.argsort(-confidence, kind='stable')
+    confidence = confidence[order]
+    n = len(confidence)
+    fast_hits = np.concatenate([[0], np.cumsum(fast_correct[order])])
+    large_hits = np.concatenate([[0], np.cumsum(large_correct[order])])
+    accuracy = 100. * (fast_hits + (large_hits[-1] - large_hits)) / n
+    
+    # k exits is only reachable when the k-th and (k+1)-th confidences differ
+    boundaries = np.flatnonzero(confidence[:-1] > confidence[1:]) + 1
+    exits = np.concatenate([[0], boundaries, [n]])
+    passing = exits[accuracy[exits] >= target_accuracy]
+    k = int(passing.max()) if len(passing) else 0
+    return {
+        # Nothing exits early at k = 0: any threshold above every confidence
+        'threshold': float(confidence[k - 1]) if k > 0 else float(np.nextafter(confidence[0], np.inf)),
+        'accuracy': float(accuracy[k]),
+        'fall_through_rate': (n - k) / n
+    }
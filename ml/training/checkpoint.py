@@ -0,0 +1,122 @@
+import os
+import glob
+import random
+import threading
+import torch
+import numpy as np
+from torch.utils.data.distributed import DistributedSampler
+
+CHECKPOINT_PATTERN = "ckpt-*.pth"
+
+def checkpoint_path(checkpoint_dir, epoch, step):
+    """Zero-padded so lexical order is training order"""
+    return os.path.join(checkpoint_dir, f"ckpt-{epoch:04d}-{step:06d}.pth")
+
+def snapshot(obj):
+    """Detached CPU copy of a (nested) state dict, safe to save from another thread"""
+    if torch.is_tensor(obj):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: snapshot(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(v) for v in obj)
+    return obj
+
+def get_rng_state():
+    state = {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+def set_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+def load_latest_checkpoint(checkpoint_dir):
+    """Newest checkpoint in the directory that loads cleanly, or None"""
+    if not checkpoint_dir or not os.path.isdir(checkpoint_dir):
+        return None
+    
+    # A spot interruption or partial S3 sync can leave a truncated file; fall back to an older one
+    for path in sorted(glob.glob(os.path.join(checkpoint_dir, CHECKPOINT_PATTERN)), reverse=True):
+        try:
+            state = torch.load(path, map_location="cpu", weights_only=False)
+        except Exception as e:
+            print(f"⚠️  Skipping unreadable checkpoint {path}: {e}")
+            continue
+        print(f"♻️  Resuming from {path}")
+        return state
+    return None
+
+class ResumableSampler(DistributedSampler):
+    """Seeded per-epoch shuffle (like DistributedSampler) that can start partway through an epoch"""
+    
+    def __init__(self, dataset, **kwargs):
+        super().__init__(dataset, **kwargs)
+        self.start_index = 0
+    
+    def set_epoch(self, epoch):
+        super().set_epoch(epoch)
+        self.start_index = 0
+    
+    def skip(self, num_samples):
+        """Drop the first num_samples of this epoch's order, already seen before an interruption"""
+        self.start_index = min(num_samples, self.num_samples)
+    
+    def __iter__(self):
+        return iter(list(super().__iter__())[self.start_index:])
+    
+    def __len__(self):
+        return self.num_samples - self.start_index
+
+class AsyncCheckpointer:
+    """Writes training state to disk on a background thread, one save in flight at a time"""
+    
+    def __init__(self, checkpoint_dir, keep=2):
+        self.checkpoint_dir = checkpoint_dir
+        self.keep = keep
+        self._thread = None
+        self._error = None
+        os.makedirs(checkpoint_dir, exist_ok=True)
+    
+    def save(self, state, epoch, step):
+        """Snapshot state now and write it in the background"""
+        # Wait for the previous write so at most one CPU copy is held in memory
+        self.wait()
+        state = snapshot(state)
+        path = checkpoint_path(self.checkpoint_dir, epoch, step)
+        self._thread = threading.Thread(target=self._write, args=(state, path), daemon=True)
+        self._thread.start()
+    
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            print(f"⚠️  Checkpoint write failed: {error}")
+    
+    def _write(self, state, path):
+        try:
+            # Write then rename so a crash mid-save never leaves a partial checkpoint under the real name
+            tmp_path = path + ".tmp"
+            torch.save(state, tmp_path)
+            os.replace(tmp_path, path)
+            self._prune()
+        except Exception as e:
+            self._error = e
+    
+    def _prune(self):
+        paths = sorted(glob.glob(os.path.join(self.checkpoint_dir, CHECKPOINT_PATTERN)))
+        for old in paths[:-self.keep]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
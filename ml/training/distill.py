@@ -0,0 +1,171 @@
+import argparse
+import copy
+import hashlib
+import json
+import os
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, Dataset
+from torchvision import datasets
+from tqdm import tqdm
+
+from inference import TRANSFORM, artifact_path, load_classes, load_eager_model, load_weights
+from precision import autocast_context
+from quantize import evaluate, measure_latency, sample_loader
+from shards import ShardDataset
+from val_cache import dataset_signature
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--student-dir", type=str, required=True)
+    parser.add_argument("--teacher-dir", type=str, required=True)
+    parser.add_argument("--validation", type=str, default=os.environ.get("SM_CHANNEL_VALIDATION", "./data/validation"))
+    parser.add_argument("--validation-shards", type=str, default=None)
+    parser.add_argument("--output-data-dir", type=str, default=os.environ.get("SM_OUTPUT_DATA_DIR", "./output"))
+    parser.add_argument("--num-workers", type=int, default=4)
+    return parser.parse_args()
+
+class IndexedDataset(Dataset):
+    """Yields (image, dataset index) so the loss can look up each sample's cached teacher logits"""
+    
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.classes = dataset.classes
+        self.targets = dataset.targets
+    
+    def __len__(self):
+        return len(self.dataset)
+    
+    def __getitem__(self, idx):
+        return self.dataset[idx][0], idx
+
+def teacher_logits_path(cache_dir, dataset, teacher_dir):
+    """Cache file keyed by the train set contents and the teacher weights"""
+    weights = os.stat(artifact_path(teacher_dir, 'eager'))
+    key = f"{dataset_signature(dataset)}-{weights.st_size}-{int(weights.st_mtime)}"
+    return os.path.join(cache_dir, f"teacher_logits_{hashlib.sha256(key.encode()).hexdigest()[:16]}.npy")
+
+def precompute_teacher_logits(teacher_dir, dataset, classes, path, device, batch_size=256, num_workers=4,
+                              precision='fp32'):
+    """Run the teacher once over the center-cropped train set and cache its logits as float16 (N, C)"""
+    if os.path.exists(path):
+        print(f"Using cached teacher logits from {path}")
+        return path
+    
+    teacher_classes = load_classes(teacher_dir)
+    if teacher_classes != classes:
+        raise ValueError(f"Teacher classes {teacher_classes} don't match the training classes {classes}")
+    teacher = load_eager_model(teacher_dir, len(classes), device)
+    
+    # Same view the teacher is served with; augmented views are what the student sees
+    dataset = copy.copy(dataset)
+    dataset.transform = TRANSFORM
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers,
+                        pin_memory=device.type == "cuda")
+    
+    chunks = []
+    with torch.no_grad():
+        for images, _ in tqdm(loader, desc="Teacher logits"):
+            with autocast_context(device, precision):
+                chunks.append(teacher(images.to(device, non_blocking=True)).float().cpu())
+    
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", 'wb') as f:
+        np.save(f, torch.cat(chunks).half().numpy())
+    os.replace(path + ".tmp", path)
+    print(f"💾 Teacher logits cached to {path}")
+    return path
+
+def load_teacher_logits(path):
+    return torch.from_numpy(np.load(path).astype(np.float32))
+
+class DistillationLoss(nn.Module):
+    """Soft-target KL to cached teacher logits blended with the usual hard-label loss
+    
+    Targets are dataset indices rather than labels. Both terms are linear in the target, so
+    mixup/cutmix mix the soft targets through mixup_criterion exactly as they mix the labels.
+    """
+    
+    def __init__(self, criterion, teacher_logits, labels, alpha=0.7, temperature=4.0):
+        super().__init__()
+        self.criterion = criterion
+        self.alpha = alpha
+        self.temperature = temperature
+        self.register_buffer('teacher_logits', teacher_logits)
+        self.register_buffer('labels', torch.as_tensor(labels, dtype=torch.long))
+    
+    def label_of(self, indices):
+        return self.labels[indices]
+    
+    def forward(self, outputs, indices):
+        hard = self.criterion(outputs, self.labels[indices])
+        
+        # T^2 keeps the soft-target gradients on the same scale as the hard ones
+        t = self.temperature
+        soft = F.kl_div(
+            F.log_softmax(outputs.float() / t, dim=1),
+            F.softmax(self.teacher_logits[indices] / t, dim=1),
+            reduction='batchmean'
+        ) * t * t
+        return self.alpha * soft + (1 - self.alpha) * hard
+
+def describe_model(model_dir, loader):
+    """Accuracy, CPU batch-1 latency and size of a served model dir"""
+    classes = load_classes(model_dir)
+    model = load_eager_model(model_dir, len(classes), torch.device("cpu"))
+    weights_path = artifact_path(model_dir, 'eager')
+    _, model_name = load_weights(weights_path)
+    top1, top5 = evaluate(model, loader)
+    return {
+        'model_name': model_name,
+        'top1': top1,
+        'top5': top5,
+        'latency_ms': measure_latency(model),
+        'params_m': sum(p.numel() for p in model.parameters()) / 1e6,
+        'weights_mb': os.path.getsize(weights_path) / 2**20
+    }
+
+def compare_with_teacher(student_dir, teacher_dir, val_dir, output_dir, val_shards=None, num_workers=4):
+    """Write distillation_report.json comparing the student with its teacher"""
+    if val_shards:
+        val_dataset = ShardDataset(val_shards, transform=TRANSFORM)
+    else:
+        val_dataset = datasets.ImageFolder(val_dir, transform=TRANSFORM)
+    loader = sample_loader(val_dataset, 0, 64, num_workers)
+    
+    report = {
+        'teacher': describe_model(teacher_dir, loader),
+        'student': describe_model(student_dir, loader)
+    }
+    teacher, student = report['teacher'], report['student']
+    report['speedup'] = teacher['latency_ms'] / student['latency_ms']
+    report['size_ratio'] = student['weights_mb'] / teacher['weights_mb']
+    
+    print("\n" + "="*60)
+    print("DISTILLATION")
+    print("="*60)
+    print(f"{'':8s} {'model':20s} {'top1':>7s} {'top5':>7s} {'ms':>7s} {'MB':>7s}")
+    for role in ('teacher', 'student'):
+        r = report[role]
+        print(f"{role:8s} {str(r['model_name']):20s} {r['top1']:6.2f}% {r['top5']:6.2f}% "
+              f"{r['latency_ms']:7.1f} {r['weights_mb']:7.1f}")
+    print(f"Student: {report['speedup']:.2f}x faster, {100 * report['size_ratio']:.0f}% of the teacher's size, "
+          f"{student['top1'] - teacher['top1']:+.2f} top-1")
+    print("="*60)
+    
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "distillation_report.json"), 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"📊 Report saved to {output_dir}/distillation_report.json")
+    return report
+
+def main():
+    args = parse_args()
+    compare_with_teacher(args.student_dir, args.teacher_dir, args.validation, args.output_data_dir,
+                         val_shards=args.validation_shards, num_workers=args.num_workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from torchvision import datasets
+from tqdm import tqdm
+
+from inference import TRANSFORM, extract_features, load_classes, load_eager_model
+from precision import autocast_context, resolve_precision
+from similarity import STORAGE_DTYPES, SimilarityIndex, save_embeddings
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-dir", type=str, default=os.environ.get("SM_MODEL_DIR", "./model"))
+    parser.add_argument("--train", type=str, default=os.environ.get("SM_CHANNEL_TRAIN", "./data/train"))
+    parser.add_argument("--validation", type=str, default=os.environ.get("SM_CHANNEL_VALIDATION", "./data/validation"))
+    parser.add_argument("--splits", type=str, nargs='+', default=["train", "validation"],
+                       choices=["train", "validation"])
+    parser.add_argument("--output", type=str, default=None,
+                       help="Matrix file prefix (default: <model-dir>/embeddings)")
+    parser.add_argument("--dtype", type=str, default="float16", choices=STORAGE_DTYPES)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--num-workers", type=int, default=4)
+    parser.add_argument("--precision", type=str, default="auto", choices=["auto", "fp32", "fp16", "bf16"])
+    parser.add_argument("--nlist", type=int, default=0, help="Also time approximate search with this many clusters")
+    parser.add_argument("--nprobe", type=int, default=8)
+    return parser.parse_args()
+
+def embed_dataset(model, dataset, device, batch_size=64, num_workers=4, precision='fp32'):
+    """L2-normalized embeddings of every image in dataset order, as float32 (N, D)"""
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers,
+                        pin_memory=device.type == "cuda")
+    chunks = []
+    with torch.no_grad():
+        for images, _ in tqdm(loader, desc="Embedding"):
+            with autocast_context(device, precision):
+                features = extract_features(model, images.to(device, non_blocking=True))
+            chunks.append(torch.nn.functional.normalize(features.float(), dim=1).cpu().numpy())
+    return np.concatenate(chunks)
+
+def time_search(index, queries, k=5):
+    """Mean ms per single-image query"""
+    start = time.perf_counter()
+    for query in queries:
+        index.search(query, k)
+    return (time.perf_counter() - start) * 1000 / len(queries)
+
+def main():
+    args = parse_args()
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    precision = resolve_precision(args.precision, device)
+    output = args.output or os.path.join(args.model_dir, "embeddings")
+    
+    classes = load_classes(args.model_dir)
+    model = load_eager_model(args.model_dir, len(classes), device)
+    
+    vectors, labels, ids = [], [], []
+    for split in args.splits:
+        root = args.train if split == "train" else args.validation
+        dataset = datasets.ImageFolder(root, transform=TRANSFORM)
+        vectors.append(embed_dataset(model, dataset, device, args.batch_size, args.num_workers, precision))
+        # Labels follow classes.json, whatever folders this split happens to contain
+        labels.extend(classes.index(dataset.classes[target]) for target in dataset.targets)
+        ids.extend(f"{split}/{os.path.relpath(path, root)}" for path, _ in dataset.samples)
+    vectors = np.concatenate(vectors)
+    
+    save_embeddings(output, vectors, labels, ids, classes, args.dtype)
+    size_mb = sum(os.path.getsize(path) for path in (output + ".npy", output + "_scale.npy") if os.path.exists(path))
+    print(f"💾 {len(vectors)} x {vectors.shape[1]} {args.dtype} embeddings saved to {output}.npy "
+          f"({size_mb / 2**20:.1f}MB)")
+    
+    # Round trip through the saved file, so quantization error shows up in the numbers below
+    query_rows = np.random.default_rng(0).choice(len(vectors), min(200, len(vectors)), replace=False)
+    queries = vectors[query_rows]
+    exact = SimilarityIndex.load(output)
+    exact_results = exact.search(queries, 5)
+    # Nearest neighbour other than the query image itself, matched by id: with duplicate or tied
+    # vectors the query need not rank first, or appear in the results at all
+    agreement = []
+    for row, result in zip(query_rows, exact_results):
+        neighbour = next((r for r in result if r['id'] != ids[row]), None)
+        if neighbour is not None:
+            agreement.append(neighbour['breed'] == classes[labels[row]])
+    same_breed = np.mean(agreement)
+    print(f"Exact search: {time_search(exact, queries):.2f}ms/query, "
+          f"nearest-neighbour breed agreement {100 * same_breed:.1f}%")
+    
+    if args.nlist > 0:
+        approximate = SimilarityIndex.load(output, nlist=args.nlist, nprobe=args.nprobe)
+        recall = np.mean([
+            len({r['id'] for r in a} & {r['id'] for r in e}) / len(e)
+            for a, e in zip(approximate.search(queries, 5), exact_results)
+        ])
+        print(f"IVF search (nlist={args.nlist}, nprobe={args.nprobe}): {time_search(approximate, queries):.2f}ms/query, "
+              f"recall@5 {100 * recall:.1f}%")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import os
+
+import torch
+
+from inference import BACKEND_FILES, OnnxModel, check_parity, load_classes, load_eager_model
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-dir", type=str, default=os.environ.get("SM_MODEL_DIR", "./model"))
+    parser.add_argument("--formats", type=str, nargs='+', default=["torchscript", "onnx"],
+                       choices=["torchscript", "onnx"])
+    parser.add_argument("--img-size", type=int, default=224)
+    return parser.parse_args()
+
+def export_torchscript(model, example, path):
+    """Trace and freeze the eager model into a TorchScript module"""
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+        frozen = torch.jit.freeze(traced)
+    frozen.save(path)
+    return frozen
+
+def export_onnx(model, example, path):
+    """Export the eager model to an ONNX graph with a dynamic batch axis"""
+    torch.onnx.export(
+        model, example, path,
+        input_names=['input'],
+        output_names=['logits'],
+        dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+        # 17 is the newest opset the TorchScript exporter in the pinned torch 2.0 supports
+        # (18 needs torch >= 2.1); onnxruntime serves it unchanged
+        opset_version=17
+    )
+
+def export_model(model_dir, formats=("torchscript", "onnx"), img_size=224):
+    """Write serving artifacts next to the trained weights and classes.json"""
+    # Export on CPU: the serving fleet is CPU-only and traced graphs bake in the device
+    device = torch.device("cpu")
+    classes = load_classes(model_dir)
+    model = load_eager_model(model_dir, len(classes), device)
+    example = torch.randn(1, 3, img_size, img_size)
+    
+    for fmt in formats:
+        path = os.path.join(model_dir, BACKEND_FILES[fmt])
+        if fmt == "torchscript":
+            exported = export_torchscript(model, example, path)
+        else:
+            export_onnx(model, example, path)
+            try:
+                exported = OnnxModel(path)
+            except ImportError:
+                print(f"📦 Exported {fmt} to {path} (onnxruntime not installed, parity not checked)")
+                continue
+        
+        max_diff = check_parity(exported, model, device)
+        print(f"📦 Exported {fmt} to {path} (max logit diff {max_diff:.2e})")
+
+def main():
+    args = parse_args()
+    export_model(args.model_dir, args.formats, args.img_size)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
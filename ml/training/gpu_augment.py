@@ -0,0 +1,250 @@
+import math
+
+import torch
+import torch.nn.functional as F
+
+MEAN = [0.485, 0.456, 0.406]
+STD = [0.229, 0.224, 0.225]
+
+def _rgb_to_hsv(img):
+    """Batched RGB -> HSV for float images in [0, 1]"""
+    r, g, b = img.unbind(dim=1)
+    maxc = img.max(dim=1).values
+    minc = img.min(dim=1).values
+    delta = maxc - minc
+    safe_delta = torch.where(delta == 0, torch.ones_like(delta), delta)
+    
+    s = delta / torch.where(maxc == 0, torch.ones_like(maxc), maxc)
+    
+    rc = (maxc - r) / safe_delta
+    gc = (maxc - g) / safe_delta
+    bc = (maxc - b) / safe_delta
+    h = torch.where(maxc == r, bc - gc, torch.where(maxc == g, 2.0 + rc - bc, 4.0 + gc - rc))
+    h = torch.where(delta == 0, torch.zeros_like(h), h)
+    h = (h / 6.0) % 1.0
+    
+    return torch.stack((h, s, maxc), dim=1)
+
+def _hsv_to_rgb(img):
+    """Batched HSV -> RGB"""
+    h, s, v = img.unbind(dim=1)
+    i = torch.floor(h * 6.0)
+    f = h * 6.0 - i
+    i = i.to(torch.int64) % 6
+    
+    p = (v * (1.0 - s)).clamp(0.0, 1.0)
+    q = (v * (1.0 - s * f)).clamp(0.0, 1.0)
+    t = (v * (1.0 - s * (1.0 - f))).clamp(0.0, 1.0)
+    
+    mask = i.unsqueeze(1) == torch.arange(6, device=img.device).view(1, -1, 1, 1)
+    r = torch.stack((v, q, p, p, t, v), dim=1)
+    g = torch.stack((t, v, v, q, p, p), dim=1)
+    b = torch.stack((p, p, t, v, v, q), dim=1)
+    
+    return torch.stack([(channel * mask).sum(dim=1) for channel in (r, g, b)], dim=1)
+
+def _grayscale(img):
+    """ITU-R 601 luma, shape (B, 1, H, W)"""
+    return (0.299 * img[:, 0:1] + 0.587 * img[:, 1:2] + 0.114 * img[:, 2:3])
+
+def _uniform(low, high, size, device):
+    return torch.empty(size, device=device).uniform_(low, high)
+
+def _solve_homography(src, dst):
+    """Batched 3x3 homographies mapping src corners (B, 4, 2) onto dst corners"""
+    batch_size = src.size(0)
+    A = torch.zeros(batch_size, 8, 8, device=src.device, dtype=src.dtype)
+    for k in range(4):
+        x, y = src[:, k, 0], src[:, k, 1]
+        u, v = dst[:, k, 0], dst[:, k, 1]
+        A[:, 2 * k, 0] = x
+        A[:, 2 * k, 1] = y
+        A[:, 2 * k, 2] = 1
+        A[:, 2 * k, 6] = -u * x
+        A[:, 2 * k, 7] = -u * y
+        A[:, 2 * k + 1, 3] = x
+        A[:, 2 * k + 1, 4] = y
+        A[:, 2 * k + 1, 5] = 1
+        A[:, 2 * k + 1, 6] = -v * x
+        A[:, 2 * k + 1, 7] = -v * y
+    rhs = dst.reshape(batch_size, 8, 1)
+    coeffs = torch.linalg.solve(A, rhs).squeeze(-1)
+    return torch.cat((coeffs, torch.ones(batch_size, 1, device=src.device, dtype=src.dtype)), dim=1).view(-1, 3, 3)
+
+class BatchAugment:
+    """Batched on-device equivalent of the per-sample PIL augmentation chain in get_transforms"""
+    
+    def __init__(self, flip_p=0.5, degrees=25, brightness=0.4, contrast=0.4, saturation=0.4, hue=0.15,
+                 translate=(0.15, 0.15), shear=10, grayscale_p=0.15, distortion_scale=0.2,
+                 perspective_p=0.3, erasing_p=0.2, erasing_scale=(0.02, 0.15), erasing_ratio=(0.3, 3.3)):
+        self.flip_p = flip_p
+        self.degrees = degrees
+        self.brightness = brightness
+        self.contrast = contrast
+        self.saturation = saturation
+        self.hue = hue
+        self.translate = translate
+        self.shear = shear
+        self.grayscale_p = grayscale_p
+        self.distortion_scale = distortion_scale
+        self.perspective_p = perspective_p
+        self.erasing_p = erasing_p
+        self.erasing_scale = erasing_scale
+        self.erasing_ratio = erasing_ratio
+    
+    def __call__(self, images):
+        """uint8 (B, 3, H, W) batch -> augmented, normalized float batch"""
+        # Same parameter distributions as the PIL chain, but the geometric ops are
+        # folded into a single resample. Colour ops are per-pixel, so running them
+        # before the warp only changes whether the black fill gets jittered (in PIL
+        # it mostly does not). Runs on whatever device the batch is on.
+        images = images.float().div_(255.0)
+        images = self.color_jitter(images)
+        images = self.random_grayscale(images)
+        images = self.geometric(images)
+        
+        mean = torch.tensor(MEAN, device=images.device).view(1, 3, 1, 1)
+        std = torch.tensor(STD, device=images.device).view(1, 3, 1, 1)
+        images = (images - mean) / std
+        
+        return self.random_erasing(images)
+    
+    def geometric(self, images):
+        """Flip -> RandomRotation -> RandomAffine -> RandomPerspective as one warp"""
+        batch_size, _, height, width = images.shape
+        device = images.device
+        eye = torch.eye(3, device=device).expand(batch_size, 3, 3)
+        cx, cy = (width - 1) / 2, (height - 1) / 2
+        
+        def about_center(matrix):
+            to_center = torch.tensor([[1, 0, -cx], [0, 1, -cy], [0, 0, 1]], device=device, dtype=matrix.dtype)
+            from_center = torch.tensor([[1, 0, cx], [0, 1, cy], [0, 0, 1]], device=device, dtype=matrix.dtype)
+            return from_center @ matrix @ to_center
+        
+        # Horizontal flip
+        flip = eye.clone()
+        flipped = torch.rand(batch_size, device=device) < self.flip_p
+        flip[flipped, 0, 0] = -1
+        flip[flipped, 0, 2] = width - 1
+        
+        # RandomRotation(degrees), always applied
+        angle = torch.deg2rad(_uniform(-self.degrees, self.degrees, batch_size, device))
+        rotation = eye.clone()
+        rotation[:, 0, 0] = torch.cos(angle)
+        rotation[:, 0, 1] = -torch.sin(angle)
+        rotation[:, 1, 0] = torch.sin(angle)
+        rotation[:, 1, 1] = torch.cos(angle)
+        rotation = about_center(rotation)
+        
+        # RandomAffine(degrees=0, translate, shear): integer pixel shifts plus x-shear
+        max_dx = self.translate[0] * width
+        max_dy = self.translate[1] * height
+        shear = torch.deg2rad(_uniform(-self.shear, self.shear, batch_size, device))
+        affine = eye.clone()
+        affine[:, 0, 1] = torch.tan(shear)
+        affine = about_center(affine)
+        affine[:, 0, 2] += torch.round(_uniform(-max_dx, max_dx, batch_size, device))
+        affine[:, 1, 2] += torch.round(_uniform(-max_dy, max_dy, batch_size, device))
+        
+        # RandomPerspective: each corner moves inward by up to distortion_scale * half size
+        perspective = eye.clone()
+        warped = torch.rand(batch_size, device=device) < self.perspective_p
+        num_warped = int(warped.sum())
+        if num_warped:
+            corners = torch.tensor(
+                [[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]],
+                device=device, dtype=torch.float32
+            ).expand(num_warped, 4, 2)
+            max_shift = torch.tensor(
+                [int(self.distortion_scale * (width // 2)), int(self.distortion_scale * (height // 2))],
+                device=device, dtype=torch.float32
+            )
+            shift = torch.floor(torch.rand(num_warped, 4, 2, device=device) * (max_shift + 1))
+            inward = torch.tensor([[1, 1], [-1, 1], [-1, -1], [1, -1]], device=device, dtype=torch.float32)
+            perspective[warped] = _solve_homography(corners, corners + shift * inward)
+        
+        # out = P(A(R(F(img)))), so walk each output pixel back through P^-1, A^-1, R^-1, F^-1
+        ys, xs = torch.meshgrid(
+            torch.arange(height, device=device, dtype=torch.float32),
+            torch.arange(width, device=device, dtype=torch.float32),
+            indexing='ij'
+        )
+        source = torch.stack((xs, ys, torch.ones_like(xs)), dim=-1).view(1, -1, 3)
+        
+        # The PIL chain crops after every step, so content that leaves the canvas in
+        # one step cannot come back in the next; track that with a validity mask
+        valid = torch.ones(batch_size, height * width, dtype=torch.bool, device=device)
+        for step in (perspective, affine, rotation, flip):
+            source = source @ torch.linalg.inv(step).transpose(1, 2)
+            source = source / source[..., 2:3]
+            valid &= ((source[..., 0] >= -0.5) & (source[..., 0] <= width - 0.5) &
+                      (source[..., 1] >= -0.5) & (source[..., 1] <= height - 0.5))
+        
+        # Pixel centres -> grid_sample's [-1, 1] coordinates (align_corners=False)
+        grid = torch.empty_like(source[..., :2])
+        grid[..., 0] = (2 * source[..., 0] + 1) / width - 1
+        grid[..., 1] = (2 * source[..., 1] + 1) / height - 1
+        grid = grid.view(batch_size, height, width, 2)
+        
+        warped_images = F.grid_sample(images, grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+        return warped_images * valid.view(batch_size, 1, height, width)
+    
+    def color_jitter(self, images):
+        """ColorJitter with per-sample factors, applied in a random order per batch"""
+        batch_size = images.size(0)
+        device = images.device
+        shape = (batch_size, 1, 1, 1)
+        
+        for op in torch.randperm(4).tolist():
+            if op == 0 and self.brightness:
+                factor = _uniform(1 - self.brightness, 1 + self.brightness, shape, device)
+                images = (images * factor).clamp_(0, 1)
+            elif op == 1 and self.contrast:
+                factor = _uniform(1 - self.contrast, 1 + self.contrast, shape, device)
+                mean = _grayscale(images).mean(dim=(1, 2, 3), keepdim=True)
+                images = (images * factor + mean * (1 - factor)).clamp_(0, 1)
+            elif op == 2 and self.saturation:
+                factor = _uniform(1 - self.saturation, 1 + self.saturation, shape, device)
+                images = (images * factor + _grayscale(images) * (1 - factor)).clamp_(0, 1)
+            elif op == 3 and self.hue:
+                shift = _uniform(-self.hue, self.hue, (batch_size, 1, 1), device)
+                hsv = _rgb_to_hsv(images)
+                hsv[:, 0] = (hsv[:, 0] + shift) % 1.0
+                images = _hsv_to_rgb(hsv)
+        
+        return images
+    
+    def random_grayscale(self, images):
+        selected = (torch.rand(images.size(0), device=images.device) < self.grayscale_p).view(-1, 1, 1, 1)
+        return torch.where(selected, _grayscale(images).expand_as(images), images)
+    
+    def random_erasing(self, images, attempts=10):
+        """RandomErasing with value 0, vectorized over the batch"""
+        batch_size, _, height, width = images.shape
+        device = images.device
+        area = height * width
+        
+        # Draw all attempts at once and keep each sample's first rectangle that fits
+        scale = _uniform(self.erasing_scale[0], self.erasing_scale[1], (batch_size, attempts), device)
+        log_ratio = _uniform(math.log(self.erasing_ratio[0]), math.log(self.erasing_ratio[1]),
+                             (batch_size, attempts), device)
+        ratio = torch.exp(log_ratio)
+        h = torch.round(torch.sqrt(scale * area * ratio))
+        w = torch.round(torch.sqrt(scale * area / ratio))
+        fits = (h < height) & (w < width)
+        
+        first = torch.argmax(fits.int(), dim=1, keepdim=True)
+        h = h.gather(1, first).squeeze(1)
+        w = w.gather(1, first).squeeze(1)
+        erase = (torch.rand(batch_size, device=device) < self.erasing_p) & fits.any(dim=1)
+        
+        top = torch.floor(torch.rand(batch_size, device=device) * (height - h + 1))
+        left = torch.floor(torch.rand(batch_size, device=device) * (width - w + 1))
+        
+        rows = torch.arange(height, device=device).view(1, -1, 1)
+        cols = torch.arange(width, device=device).view(1, 1, -1)
+        mask = ((rows >= top.view(-1, 1, 1)) & (rows < (top + h).view(-1, 1, 1)) &
+                (cols >= left.view(-1, 1, 1)) & (cols < (left + w).view(-1, 1, 1)) &
+                erase.view(-1, 1, 1))
+        
+        return images.masked_fill(mask.unsqueeze(1), 0.0)
\ No newline at end of file
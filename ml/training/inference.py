@@ -2,80 +2,468 @@ import torch
 import torch.nn as nn
 from torchvision import transforms, models
 from PIL import Image
+import base64
+import inspect
 import json
 import os
 import io
 
-def model_fn(model_dir):
-    """Load model for inference"""
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    
-    # Load classes
+try:
+    import simplejpeg  # libjpeg-turbo bindings with scaled decoding
+except ImportError:
+    simplejpeg = None
+
+from batching import MicroBatcher
+from cascade import CascadeStats, load_threshold, run_cascade
+from cache import PredictionCache, content_hash
+from precision import resolve_precision, autocast_context, to_channels_last
+from preprocess import Preprocessor
+from similarity import SimilarityIndex
+
+TOP_K = 5
+
+# Full training checkpoint (optimizer state, history) written by train.py
+CHECKPOINT_FILE = 'model.pth'
+
+# Serialized model artifact per INFERENCE_BACKEND
+BACKEND_FILES = {
+    'eager': 'model_weights.pth',
+    'torchscript': 'model_torchscript.pt',
+    'onnx': 'model.onnx',
+    'int8': 'model_int8.pt'
+}
+
+# Optional content-hash prediction cache, configured in model_fn
+_prediction_cache = None
+
+# Short side TRANSFORM resizes to; decoding any larger than this is wasted work
+DECODE_SHORT_SIDE = 256
+
+# For model dicts built without load_serving_model
+_DEFAULT_PREPROCESS = Preprocessor(DECODE_SHORT_SIDE, 224)
+
+# Uploads beyond these limits are rejected before any pixels are decoded
+MAX_REQUEST_BYTES = int(os.environ.get("INFERENCE_MAX_REQUEST_BYTES", 25 * 2**20))
+MAX_IMAGE_PIXELS = int(os.environ.get("INFERENCE_MAX_IMAGE_PIXELS", 50_000_000))
+
+# Decode straight to near the target size (JPEG draft/DCT scaling, reduce() for other formats)
+FAST_DECODE = os.environ.get("INFERENCE_FAST_DECODE", "1") == "1"
+
+# Per-image reference pipeline (datasets, offline tools); serving batches go through Preprocessor,
+# which produces the same tensors without the per-image float intermediates
+TRANSFORM = transforms.Compose([
+    transforms.Resize(DECODE_SHORT_SIDE),
+    transforms.CenterCrop(224),
+    transforms.ToTensor(),
+    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+])
+
+def load_classes(model_dir):
+    """Read the class list saved next to the model"""
     with open(os.path.join(model_dir, "classes.json"), 'r') as f:
         class_data = json.load(f)
-        classes = class_data['classes']
+        return class_data['classes']
+
+def build_inference_model(model_name, num_classes):
+    """Build the train.py architecture without downloading pretrained weights"""
+    if model_name in ("mobilenet_v3_small", "mobilenet_v3_large"):
+        # Distilled students keep the torchvision head with only the output layer resized
+        return getattr(models, model_name)(num_classes=num_classes)
+    if model_name not in ("efficientnet_b0", "efficientnet_b1", "efficientnet_b2"):
+        raise ValueError(f"Unsupported model architecture: {model_name}")
     
-    # Build model
-    model = models.efficientnet_b0()
+    model = getattr(models, model_name)()
     in_features = model.classifier[1].in_features
     model.classifier = nn.Sequential(
-        nn.Dropout(0.2),
-        nn.Linear(in_features, len(classes))
+        nn.Dropout(0.5),
+        nn.Linear(in_features, num_classes)
     )
+    return model
+
+def artifact_path(model_dir, backend):
+    """Path of the artifact a backend loads"""
+    path = os.path.join(model_dir, BACKEND_FILES[backend])
+    # Model dirs trained before model_weights.pth existed only have the full checkpoint
+    if backend == 'eager' and not os.path.exists(path):
+        return os.path.join(model_dir, CHECKPOINT_FILE)
+    return path
+
+def load_weights(path):
+    """Load model weights and architecture name, skipping optimizer state"""
+    # weights_only refuses arbitrary pickled objects on every torch version we run;
+    # mmap keeps the tensors file-backed instead of copying them into the heap (torch >= 2.1)
+    load_kwargs = {'map_location': 'cpu', 'weights_only': True}
+    if 'mmap' in inspect.signature(torch.load).parameters:
+        load_kwargs['mmap'] = True
+    checkpoint = torch.load(path, **load_kwargs)
+    
+    if 'model_name' in checkpoint:
+        return checkpoint['model_state_dict'], checkpoint['model_name']
+    # Full training checkpoint: the architecture is recorded in the saved args
+    return checkpoint['model_state_dict'], checkpoint.get('args', {}).get('model', 'efficientnet_b0')
+
+def load_eager_model(model_dir, num_classes, device):
+    """Rebuild the eager PyTorch model from the saved weights"""
+    state_dict, model_name = load_weights(artifact_path(model_dir, 'eager'))
+    
+    # Build on the meta device and adopt the loaded tensors instead of initializing and copying
+    if 'assign' in inspect.signature(nn.Module.load_state_dict).parameters:
+        with torch.device('meta'):
+            model = build_inference_model(model_name, num_classes)
+        model.load_state_dict(state_dict, assign=True)
+    else:
+        model = build_inference_model(model_name, num_classes)
+        model.load_state_dict(state_dict)
     
-    # Load weights
-    checkpoint = torch.load(os.path.join(model_dir, "model.pth"), map_location=device)
-    model.load_state_dict(checkpoint['model_state_dict'])
     model = model.to(device)
     model.eval()
     
-    return {'model': model, 'classes': classes, 'device': device}
+    return model
+
+class OnnxModel:
+    """Callable wrapper giving an onnxruntime session the eager model interface"""
+    
+    def __init__(self, path):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("INFERENCE_BACKEND=onnx requires onnxruntime: pip install onnxruntime")
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+    
+    def __call__(self, batch):
+        logits = self.session.run(None, {self.input_name: batch.cpu().numpy()})[0]
+        return torch.from_numpy(logits)
+
+def load_model(model_dir, backend, num_classes, device):
+    """Load the model artifact for the requested backend"""
+    if backend == 'eager':
+        return load_eager_model(model_dir, num_classes, device)
+    if backend in ('torchscript', 'int8'):
+        model = torch.jit.load(os.path.join(model_dir, BACKEND_FILES[backend]), map_location=device)
+        model.eval()
+        return model
+    if backend == 'onnx':
+        return OnnxModel(os.path.join(model_dir, BACKEND_FILES['onnx']))
+    raise ValueError(f"Unsupported inference backend: {backend}")
+
+def optimize_eager_model(model, channels_last=False, compile_model=False):
+    """Apply NHWC layout and torch.compile to an eager model"""
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    if compile_model:
+        model = torch.compile(model)
+    return model
+
+def warm_up(model_dict, batch_sizes=(1,), img_size=224):
+    """Run dummy batches so compilation and kernel selection happen before the first request"""
+    device = model_dict['device']
+    models = [model_dict['model']] + ([model_dict['fast_model']] if 'fast_model' in model_dict else [])
+    for batch_size in batch_sizes:
+        batch = to_channels_last(torch.randn(batch_size, 3, img_size, img_size, device=device),
+                                 model_dict['channels_last'])
+        with torch.no_grad(), autocast_context(device, model_dict['precision']):
+            for model in models:
+                model(batch)
+
+def check_parity(model, reference, device, rtol=1e-3, atol=1e-3):
+    """Compare an exported model's logits against the eager model"""
+    example = torch.randn(2, 3, 224, 224, device=device)
+    with torch.no_grad():
+        expected = reference(example).cpu()
+        actual = model(example).cpu()
+    max_diff = (expected - actual).abs().max().item()
+    if not torch.allclose(actual, expected, rtol=rtol, atol=atol):
+        raise ValueError(f"Exported model diverges from eager logits (max diff {max_diff:.2e})")
+    return max_diff
+
+def load_serving_model(model_dir):
+    """Load the model artifact, classes and numerics settings; no per-process serving state"""
+    # Load the artifact chosen by INFERENCE_BACKEND (eager, torchscript, onnx or int8)
+    backend = os.environ.get("INFERENCE_BACKEND", "eager")
+    
+    # Quantized kernels only run on CPU
+    use_cuda = torch.cuda.is_available() and backend != 'int8'
+    device = torch.device("cuda" if use_cuda else "cpu")
+    
+    # Load classes
+    classes = load_classes(model_dir)
+    
+    model = load_model(model_dir, backend, len(classes), device)
+    
+    if backend != 'eager' and os.environ.get("INFERENCE_PARITY_CHECK", "0") == "1":
+        max_diff = check_parity(model, load_eager_model(model_dir, len(classes), device), device)
+        print(f"{backend} parity check passed (max logit diff {max_diff:.2e})")
+    
+    # Autocast dtype and NHWC layout (the latter only applies to the eager backend)
+    precision = resolve_precision(os.environ.get("INFERENCE_PRECISION", "fp32"), device)
+    channels_last = os.environ.get("INFERENCE_CHANNELS_LAST", "0") == "1" and backend == 'eager'
+    model = optimize_eager_model(model, channels_last)
+    
+    model_dict = {
+        'model': model,
+        'classes': classes,
+        'device': device,
+        'backend': backend,
+        'precision': precision,
+        'channels_last': channels_last,
+        'preprocess': Preprocessor(DECODE_SHORT_SIDE, 224, channels_last)
+    }
+    
+    # Cascade: a small model (e.g. a distilled student) answers first, this one only when it is unsure
+    fast_model_dir = os.environ.get("INFERENCE_CASCADE_MODEL_DIR")
+    if fast_model_dir:
+        if load_classes(fast_model_dir) != classes:
+            raise ValueError(f"Cascade model in {fast_model_dir} was trained on different classes")
+        model_dict['fast_model'] = optimize_eager_model(load_model(fast_model_dir, backend, len(classes), device),
+                                                        channels_last)
+        model_dict['cascade_threshold'] = float(os.environ.get("INFERENCE_CASCADE_THRESHOLD",
+                                                               load_threshold(model_dir)))
+    
+    return model_dict
+
+def cache_namespace(model_dict, model_dir):
+    """Everything that changes a prediction for the same image bytes, so a redeploy never serves stale results"""
+    def weights_version(directory):
+        stat = os.stat(artifact_path(directory, model_dict['backend']))
+        return f"{stat.st_size}-{int(stat.st_mtime)}"
+    
+    parts = [weights_version(model_dir), model_dict['precision'], f"fastdecode{int(FAST_DECODE)}"]
+    if 'fast_model' in model_dict:
+        parts += [weights_version(os.environ["INFERENCE_CASCADE_MODEL_DIR"]), f"cascade{model_dict['cascade_threshold']}"]
+    return "-".join(parts)
+
+def attach_serving(model_dict, model_dir):
+    """Per-process serving state: torch.compile, micro-batcher thread and prediction cache"""
+    global _prediction_cache
+    backend = model_dict['backend']
+    
+    max_batch_size = int(os.environ.get("INFERENCE_MAX_BATCH_SIZE", 1))
+    if os.environ.get("INFERENCE_COMPILE", "0") == "1" and backend == 'eager':
+        model_dict['model'] = optimize_eager_model(model_dict['model'], compile_model=True)
+        if 'fast_model' in model_dict:
+            model_dict['fast_model'] = optimize_eager_model(model_dict['fast_model'], compile_model=True)
+        # Compile for both shapes the micro-batcher produces so no request waits on it
+        warm_up(model_dict, sorted({1, max_batch_size}))
+    
+    # Fall-through counters are per process, like the batcher histograms
+    if 'fast_model' in model_dict:
+        model_dict['cascade'] = CascadeStats(model_dict['cascade_threshold'])
+    
+    # Micro-batching of concurrent requests (disabled when max batch size is 1)
+    if max_batch_size > 1:
+        model_dict['batcher'] = MicroBatcher(
+            lambda images: predict_batch_fn(images, model_dict),
+            max_batch_size=max_batch_size,
+            max_wait_ms=float(os.environ.get("INFERENCE_MAX_BATCH_WAIT_MS", 5))
+        )
+    
+    # Prediction cache (disabled when size is 0); INFERENCE_CACHE_PATH adds a sqlite tier
+    cache_size = int(os.environ.get("INFERENCE_CACHE_SIZE", 0))
+    if cache_size > 0:
+        _prediction_cache = PredictionCache(
+            max_entries=cache_size,
+            ttl_seconds=float(os.environ.get("INFERENCE_CACHE_TTL_SECONDS", 3600)),
+            disk_path=os.environ.get("INFERENCE_CACHE_PATH"),
+            namespace=cache_namespace(model_dict, model_dir)
+        )
+        model_dict['cache'] = _prediction_cache
+    
+    # "Similar cats" index written by embeddings.py; per process since it takes incremental adds
+    index_path = os.environ.get("INFERENCE_INDEX_PATH")
+    if index_path:
+        model_dict['index'] = SimilarityIndex.load(
+            index_path,
+            nlist=int(os.environ.get("INFERENCE_INDEX_NLIST", 0)),
+            nprobe=int(os.environ.get("INFERENCE_INDEX_NPROBE", 8))
+        )
+    
+    return model_dict
+
+def model_fn(model_dir):
+    """Load model for inference"""
+    return attach_serving(load_serving_model(model_dir), model_dir)
+
+def decode_image(image_bytes, fast=None):
+    """Decode raw image bytes to an RGB PIL image, at no more resolution than TRANSFORM keeps"""
+    if len(image_bytes) > MAX_REQUEST_BYTES:
+        raise ValueError(f"Image is {len(image_bytes) / 2**20:.1f}MB; the limit is {MAX_REQUEST_BYTES / 2**20:.0f}MB")
+    
+    # Corrupt, truncated or non-image uploads are bad client input (400), not a server error
+    try:
+        return _decode(image_bytes, FAST_DECODE if fast is None else fast)
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Could not decode image: {e}") from e
+
+def _decode(image_bytes, fast):
+    # Image.open only parses the header, so the size check costs no decoding
+    img = Image.open(io.BytesIO(image_bytes))
+    width, height = img.size
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ValueError(f"Image is {width}x{height}; the limit is {MAX_IMAGE_PIXELS / 1e6:.0f} megapixels")
+    
+    if not fast:
+        return img.convert('RGB')
+    
+    if img.format == 'JPEG':
+        if simplejpeg is not None:
+            # libjpeg-turbo picks the smallest DCT scale that keeps both sides at or above the minimum
+            scale = DECODE_SHORT_SIDE / min(width, height)
+            pixels = simplejpeg.decode_jpeg(
+                image_bytes, colorspace='RGB',
+                min_width=min(width, round(width * scale)), min_height=min(height, round(height * scale))
+            )
+            return Image.fromarray(pixels)
+        # Draft mode decodes at 1/2, 1/4 or 1/8 scale, never below the requested size
+        img.draft('RGB', (DECODE_SHORT_SIDE, DECODE_SHORT_SIDE))
+        return img.convert('RGB')
+    
+    # Other formats decode fully; shrink by an integer factor before the bilinear resize
+    img = img.convert('RGB')
+    factor = min(img.size) // DECODE_SHORT_SIDE
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img
+
+def load_image(image_bytes):
+    """Decode image bytes, or return the cached prediction for identical bytes"""
+    if _prediction_cache is None:
+        return decode_image(image_bytes)
+    
+    digest = content_hash(image_bytes)
+    cached = _prediction_cache.get(digest)
+    if cached is not None:
+        return cached
+    
+    image = decode_image(image_bytes)
+    image.info['content_hash'] = digest
+    return image
 
 def input_fn(request_body, content_type='application/x-image'):
     """Process input image"""
     if content_type == 'application/x-image':
-        image = Image.open(io.BytesIO(request_body)).convert('RGB')
+        image = load_image(request_body)
         return image
+    elif content_type == 'application/json':
+        # Batch request: {"images": ["<base64>", ...]}
+        payload = json.loads(request_body)
+        images = payload.get('images') if isinstance(payload, dict) else None
+        if not isinstance(images, list) or not images:
+            raise ValueError("Batch request must be {\"images\": [<base64>, ...]}")
+        return [load_image(base64.b64decode(image)) for image in images]
     else:
         raise ValueError(f"Unsupported content type: {content_type}")
 
+def format_prediction(probabilities, classes, top_k=TOP_K):
+    """Build the response dict from one row of class probabilities"""
+    top_prob, top_idx = probabilities.topk(min(top_k, len(classes)))
+    top_breeds = [
+        {
+            'breed': classes[idx],
+            'confidence': float(prob)
+        }
+        for idx, prob in zip(top_idx.tolist(), top_prob.tolist())
+    ]
+    
+    return {
+        'breed': top_breeds[0]['breed'],
+        'confidence': top_breeds[0]['confidence'],
+        'top_breeds': top_breeds
+    }
+
 def predict_fn(input_data, model_dict):
     """Make prediction"""
-    model = model_dict['model']
+    if isinstance(input_data, list):
+        return predict_batch_fn(input_data, model_dict)
+    
+    # Cache hit in input_fn: nothing left to compute
+    if isinstance(input_data, dict):
+        return input_data
+    
+    # Concurrent single-image requests share one forward pass
+    if 'batcher' in model_dict:
+        return model_dict['batcher'].predict(input_data)
+    
+    return predict_batch_fn([input_data], model_dict)[0]
+
+def preprocess_batch(images, model_dict):
+    """Model-ready batch on the serving device; a view of a reused buffer when that is the CPU"""
+    preprocess = model_dict.get('preprocess') or _DEFAULT_PREPROCESS
+    batch = preprocess.batch(images).to(model_dict['device'])
+    return to_channels_last(batch, model_dict.get('channels_last', False))
+
+def forward_probabilities(model, batch, model_dict):
+    """Softmax over one model's logits under the serving precision"""
+    with torch.no_grad(), autocast_context(model_dict['device'], model_dict.get('precision', 'fp32')):
+        outputs = model(batch)
+    return torch.nn.functional.softmax(outputs.float(), dim=1)
+
+def batch_probabilities(batch, model_dict):
+    """CPU class probabilities for a preprocessed batch, through the cascade when one is configured"""
+    if 'fast_model' not in model_dict:
+        return forward_probabilities(model_dict['model'], batch, model_dict).cpu()
+    return run_cascade(
+        lambda images: forward_probabilities(model_dict['fast_model'], images, model_dict),
+        lambda images: forward_probabilities(model_dict['model'], images, model_dict),
+        batch, model_dict['cascade_threshold'], model_dict.get('cascade')
+    )
+
+def predict_batch_fn(images, model_dict, top_k=TOP_K):
+    """Run a list of images through the model in a single forward pass"""
     classes = model_dict['classes']
-    device = model_dict['device']
     
-    # Transform
-    transform = transforms.Compose([
-        transforms.Resize(256),
-        transforms.CenterCrop(224),
-        transforms.ToTensor(),
-        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-    ])
+    # Cache hits from input_fn arrive as finished prediction dicts
+    results = list(images)
+    pending = [i for i, image in enumerate(images) if not isinstance(image, dict)]
+    if not pending:
+        return results
     
-    image_tensor = transform(input_data).unsqueeze(0).to(device)
+    batch = preprocess_batch([images[i] for i in pending], model_dict)
     
     # Predict
-    with torch.no_grad():
-        outputs = model(image_tensor)
-        probabilities = torch.nn.functional.softmax(outputs, dim=1)
-        confidence, predicted = probabilities.max(1)
+    probabilities = batch_probabilities(batch, model_dict)
     
-    # Get top 5 predictions
-    top5_prob, top5_idx = probabilities[0].topk(5)
-    top5_breeds = [
-        {
-            'breed': classes[idx],
-            'confidence': float(prob)
-        }
-        for idx, prob in zip(top5_idx.tolist(), top5_prob.tolist())
-    ]
+    for i, row in zip(pending, probabilities):
+        results[i] = format_prediction(row, classes, top_k)
+        digest = images[i].info.get('content_hash')
+        if digest is not None and _prediction_cache is not None:
+            _prediction_cache.put(digest, results[i])
     
-    return {
-        'breed': classes[predicted.item()],
-        'confidence': float(confidence.item()),
-        'top_breeds': top5_breeds
-    }
+    return results
+
+def extract_features(model, batch):
+    """Pooled penultimate features that model.classifier sees"""
+    # torch.compile wraps the module; the submodules live on the original
+    model = getattr(model, '_orig_mod', model)
+    if not hasattr(model, 'features'):
+        raise ValueError("Embeddings need the eager backend")
+    return torch.flatten(model.avgpool(model.features(batch)), 1)
+
+def embed_batch_fn(images, model_dict):
+    """L2-normalized embeddings of decoded images as a float32 (N, D) CPU tensor"""
+    device = model_dict['device']
+    batch = preprocess_batch(images, model_dict)
+    
+    with torch.no_grad(), autocast_context(device, model_dict.get('precision', 'fp32')):
+        features = extract_features(model_dict['model'], batch)
+    return torch.nn.functional.normalize(features.float(), dim=1).cpu()
+
+def embed_fn(input_data, model_dict):
+    """Embedding of one image from decode_image, or (N, D) for a list of them"""
+    if isinstance(input_data, list):
+        return embed_batch_fn(input_data, model_dict)
+    return embed_batch_fn([input_data], model_dict)[0]
+
+def similar_fn(input_data, model_dict, k=TOP_K):
+    """Nearest indexed images and their breeds for one decoded image, or a list of them"""
+    if 'index' not in model_dict:
+        raise ValueError("No similarity index loaded; set INFERENCE_INDEX_PATH")
+    images = input_data if isinstance(input_data, list) else [input_data]
+    neighbours = model_dict['index'].search(embed_batch_fn(images, model_dict).numpy(), k)
+    return neighbours if isinstance(input_data, list) else neighbours[0]
 
 def output_fn(prediction, accept='application/json'):
     """Format output"""
@@ -0,0 +1,35 @@
+from contextlib import nullcontext
+
+import torch
+from torch.amp import GradScaler
+
+PRECISIONS = {
+    'fp32': None,
+    'fp16': torch.float16,
+    'bf16': torch.bfloat16
+}
+
+def resolve_precision(precision, device):
+    """Map 'auto' to fp16 on CUDA and fp32 elsewhere, and reject combinations the device can't run"""
+    if precision == 'auto':
+        return 'fp16' if device.type == 'cuda' else 'fp32'
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unsupported precision: {precision}")
+    if precision == 'fp16' and device.type != 'cuda':
+        raise ValueError("fp16 autocast needs a CUDA device; use bf16 on CPU")
+    return precision
+
+def autocast_context(device, precision):
+    """Mixed-precision context for the device the model runs on (no-op for fp32)"""
+    dtype = PRECISIONS[precision]
+    if dtype is None:
+        return nullcontext()
+    return torch.autocast(device_type=device.type, dtype=dtype)
+
+def make_grad_scaler(device, precision):
+    """Loss scaling is only needed for fp16; bf16 has fp32's exponent range"""
+    return GradScaler('cuda', enabled=device.type == 'cuda' and precision == 'fp16')
+
+def to_channels_last(tensor, enabled):
+    """NHWC layout for 4D image batches, which conv kernels run faster on"""
+    return tensor.contiguous(memory_format=torch.channels_last) if enabled else tensor
@@ -0,0 +1,168 @@
+import json
+import os
+import time
+import resource
+from collections import defaultdict
+from contextlib import nullcontext
+
+import numpy as np
+import torch
+
+_NULL = nullcontext()
+
+class _Stage:
+    """Times one stage of a step; the device is synced on both edges so async kernels are attributed correctly"""
+    
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.record = None
+    
+    def __enter__(self):
+        if self.profiler._trace is not None:
+            self.record = torch.profiler.record_function(self.name)
+            self.record.__enter__()
+        self.profiler._sync()
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.profiler._sync()
+        self.profiler._step[self.name] += time.perf_counter() - self.start
+        if self.record is not None:
+            self.record.__exit__(*exc)
+        return False
+
+class StepProfiler:
+    """Per-step stage timings, throughput and peak memory for train_epoch/validate
+    
+    Disabled instances hand out a shared null context, so the loops can be instrumented unconditionally.
+    With trace_dir set, a torch.profiler window covers the first training epoch.
+    """
+    
+    def __init__(self, device, enabled=False, trace_dir=None, trace_wait=5, trace_steps=10):
+        self.device = device
+        self.enabled = enabled
+        self.trace_dir = trace_dir if enabled else None
+        self.trace_wait = trace_wait
+        self.trace_steps = trace_steps
+        self._trace = None
+        self._traced = False
+        self.epochs = []
+        self.steps = []
+    
+    def _sync(self):
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+    
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL
+        return _Stage(self, name)
+    
+    def start(self, phase, epoch):
+        """Begin a train/validation pass"""
+        if not self.enabled:
+            return
+        self._phase = phase
+        self._epoch = epoch
+        self._records = []
+        self._step = defaultdict(float)
+        self._samples = 0
+        if self.device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(self.device)
+        
+        if phase == "train" and self.trace_dir and not self._traced:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if self.device.type == "cuda":
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self._trace = torch.profiler.profile(
+                activities=activities,
+                schedule=torch.profiler.schedule(wait=self.trace_wait, warmup=1, active=self.trace_steps, repeat=1),
+                on_trace_ready=torch.profiler.tensorboard_trace_handler(self.trace_dir),
+                profile_memory=True
+            )
+            self._trace.start()
+            self._traced = True
+        
+        self._sync()
+        self._pass_start = time.perf_counter()
+        self._step_start = self._pass_start
+    
+    def iterate(self, loader):
+        """Yield batches from the loader, timing how long each one took to arrive as data_wait"""
+        if not self.enabled:
+            yield from loader
+            return
+        iterator = iter(loader)
+        while True:
+            wait_start = time.perf_counter()
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return
+            self._step['data_wait'] += time.perf_counter() - wait_start
+            yield batch
+    
+    def step(self, batch_size):
+        """Close the current step"""
+        if not self.enabled:
+            return
+        self._sync()
+        now = time.perf_counter()
+        self._step['step'] = now - self._step_start
+        self._step_start = now
+        self._samples += batch_size
+        self._records.append(dict(self._step))
+        self._step = defaultdict(float)
+        if self._trace is not None:
+            self._trace.step()
+    
+    def stop(self):
+        """End the pass and return its summary"""
+        if not self.enabled:
+            return None
+        if self._trace is not None:
+            self._trace.stop()
+            self._trace = None
+        
+        elapsed = time.perf_counter() - self._pass_start
+        stages = {}
+        for name in sorted({k for r in self._records for k in r}):
+            times = np.array([r.get(name, 0.0) for r in self._records]) * 1000
+            stages[name] = {
+                'mean_ms': float(times.mean()),
+                'p50_ms': float(np.percentile(times, 50)),
+                'p95_ms': float(np.percentile(times, 95)),
+                'total_s': float(times.sum() / 1000)
+            }
+        
+        summary = {
+            'phase': self._phase,
+            'epoch': self._epoch,
+            'steps': len(self._records),
+            'samples': self._samples,
+            'seconds': elapsed,
+            'samples_per_sec': self._samples / elapsed if elapsed > 0 else 0.0,
+            # ru_maxrss is in KB on Linux and is the process lifetime peak
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'stages': stages
+        }
+        if self.device.type == "cuda":
+            summary['peak_cuda_memory_mb'] = torch.cuda.max_memory_allocated(self.device) / 2**20
+        
+        self.epochs.append(summary)
+        self.steps.extend({'phase': self._phase, 'epoch': self._epoch, 'step': i, **r}
+                          for i, r in enumerate(self._records))
+        return summary
+    
+    def save(self, output_dir):
+        """Per-pass summaries as JSON and per-step timings (seconds) as JSON lines"""
+        if not self.enabled:
+            return
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, "training_profile.json"), 'w') as f:
+            json.dump(self.epochs, f, indent=2)
+        with open(os.path.join(output_dir, "training_profile_steps.jsonl"), 'w') as f:
+            for record in self.steps:
+                f.write(json.dumps(record) + "\n")
@@ -0,0 +1,173 @@
+import argparse
+import copy
+import json
+import multiprocessing as mp
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, Subset
+from torchvision import datasets
+
+from inference import BACKEND_FILES, TRANSFORM, artifact_path, load_classes, load_eager_model, model_fn
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-dir", type=str, default=os.environ.get("SM_MODEL_DIR", "./model"))
+    parser.add_argument("--validation", type=str, default=os.environ.get("SM_CHANNEL_VALIDATION", "./data/validation"))
+    parser.add_argument("--mode", type=str, default="static", choices=["dynamic", "static"])
+    parser.add_argument("--calibration-samples", type=int, default=512)
+    parser.add_argument("--eval-samples", type=int, default=0, help="0 evaluates the full validation set")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--num-workers", type=int, default=4)
+    return parser.parse_args()
+
+def sample_loader(dataset, num_samples, batch_size, num_workers, seed=42):
+    """DataLoader over a fixed random subset (or all) of the dataset"""
+    if 0 < num_samples < len(dataset):
+        indices = np.random.default_rng(seed).choice(len(dataset), num_samples, replace=False)
+        dataset = Subset(dataset, indices.tolist())
+    return DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+
+def quantize_dynamic(model):
+    """Dynamic INT8: weights quantized ahead of time, activations on the fly"""
+    # Only nn.Linear has dynamic kernels, so for EfficientNet this covers the classifier head
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+def quantize_static(model, calibration_loader, img_size=224):
+    """Static INT8 via FX graph mode, calibrated on validation images"""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+    
+    example = (torch.randn(1, 3, img_size, img_size),)
+    prepared = prepare_fx(model, get_default_qconfig_mapping("x86"), example)
+    
+    with torch.no_grad():
+        for images, _ in calibration_loader:
+            prepared(images)
+    
+    return convert_fx(prepared)
+
+def evaluate(model, loader):
+    """Top-1 / top-5 accuracy in percent"""
+    top1 = 0
+    top5 = 0
+    total = 0
+    with torch.no_grad():
+        for images, labels in loader:
+            outputs = model(images)
+            top5_idx = outputs.topk(min(5, outputs.size(1)), dim=1).indices
+            top1 += top5_idx[:, 0].eq(labels).sum().item()
+            top5 += top5_idx.eq(labels.unsqueeze(1)).any(dim=1).sum().item()
+            total += labels.size(0)
+    return 100. * top1 / total, 100. * top5 / total
+
+def measure_latency(model, img_size=224, iterations=30, warmup=5):
+    """Median batch-1 forward latency in ms"""
+    example = torch.randn(1, 3, img_size, img_size)
+    timings = []
+    with torch.no_grad():
+        for i in range(warmup + iterations):
+            start = time.perf_counter()
+            model(example)
+            if i >= warmup:
+                timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+def _rss_worker(model_dir, backend, result_queue):
+    os.environ["INFERENCE_BACKEND"] = backend
+    model_dict = model_fn(model_dir)
+    with torch.no_grad():
+        model_dict['model'](torch.randn(1, 3, 224, 224))
+    
+    # VmRSS is current resident memory, VmHWM the peak
+    status = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                status[key] = int(value.split()[0]) / 1024
+    result_queue.put(status)
+
+def measure_rss(model_dir, backend):
+    """Resident memory (MB) of a fresh process serving the given backend"""
+    if not os.path.exists("/proc/self/status"):
+        return {}
+    ctx = mp.get_context("spawn")
+    result_queue = ctx.Queue()
+    process = ctx.Process(target=_rss_worker, args=(model_dir, backend, result_queue))
+    process.start()
+    result = result_queue.get()
+    process.join()
+    return {'rss_mb': result.get("VmRSS"), 'peak_rss_mb': result.get("VmHWM")}
+
+def main():
+    args = parse_args()
+    torch.backends.quantized.engine = "x86" if "x86" in torch.backends.quantized.supported_engines else "qnnpack"
+    
+    # Quantized kernels are CPU-only
+    device = torch.device("cpu")
+    classes = load_classes(args.model_dir)
+    model = load_eager_model(args.model_dir, len(classes), device)
+    
+    val_dataset = datasets.ImageFolder(args.validation, transform=TRANSFORM)
+    eval_loader = sample_loader(val_dataset, args.eval_samples, args.batch_size, args.num_workers)
+    
+    print(f"Quantizing ({args.mode})...")
+    if args.mode == "dynamic":
+        quantized = quantize_dynamic(copy.deepcopy(model))
+    else:
+        calibration_loader = sample_loader(val_dataset, args.calibration_samples, args.batch_size, args.num_workers)
+        quantized = quantize_static(copy.deepcopy(model), calibration_loader)
+    
+    # Save as frozen TorchScript so model_fn can load it without the FX/quant tooling
+    example = torch.randn(1, 3, 224, 224)
+    with torch.no_grad():
+        scripted = torch.jit.freeze(torch.jit.trace(quantized, example))
+    int8_path = os.path.join(args.model_dir, BACKEND_FILES['int8'])
+    scripted.save(int8_path)
+    print(f"💾 Quantized model saved to {int8_path}")
+    
+    print("Evaluating fp32 vs int8...")
+    fp32_top1, fp32_top5 = evaluate(model, eval_loader)
+    int8_top1, int8_top5 = evaluate(scripted, eval_loader)
+    
+    report = {
+        'mode': args.mode,
+        'eval_samples': len(eval_loader.dataset),
+        'fp32': {
+            'top1': fp32_top1,
+            'top5': fp32_top5,
+            'latency_ms': measure_latency(model),
+            'size_mb': os.path.getsize(artifact_path(args.model_dir, 'eager')) / 2**20,
+            **measure_rss(args.model_dir, 'eager')
+        },
+        'int8': {
+            'top1': int8_top1,
+            'top5': int8_top5,
+            'latency_ms': measure_latency(scripted),
+            'size_mb': os.path.getsize(int8_path) / 2**20,
+            **measure_rss(args.model_dir, 'int8')
+        }
+    }
+    report['top1_delta'] = int8_top1 - fp32_top1
+    report['top5_delta'] = int8_top5 - fp32_top5
+    
+    report_path = os.path.join(args.model_dir, "quantization_report.json")
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    print("\n" + "="*60)
+    print(f"{'':8s} {'Top-1':>8s} {'Top-5':>8s} {'ms/img':>8s} {'Size MB':>8s} {'RSS MB':>8s}")
+    for name in ('fp32', 'int8'):
+        r = report[name]
+        rss = f"{r['rss_mb']:.0f}" if r.get('rss_mb') else "n/a"
+        print(f"{name:8s} {r['top1']:8.2f} {r['top5']:8.2f} {r['latency_ms']:8.1f} {r['size_mb']:8.1f} {rss:>8s}")
+    print(f"Delta:   {report['top1_delta']:+8.2f} {report['top5_delta']:+8.2f}")
+    print("="*60)
+    print(f"\n📊 Report saved to {report_path}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
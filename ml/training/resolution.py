@@ -0,0 +1,73 @@
+import torch
+from torchvision import transforms
+
+# Matches the original 192 -> 208 -> 224 progressive resize
+PROGRESSIVE_SCHEDULE = [(0, 192), (10, 208), (20, 224)]
+
+def parse_resize_schedule(spec):
+    """Parse "0:160,5:192,15:224" into [(0, 160), (5, 192), (15, 224)], sorted by start epoch"""
+    schedule = []
+    for item in spec.split(","):
+        epoch, size = item.split(":")
+        schedule.append((int(epoch), int(size)))
+    schedule.sort()
+    if not schedule or schedule[0][0] != 0:
+        raise ValueError(f"Resize schedule must start at epoch 0: {spec}")
+    return schedule
+
+def size_for_epoch(schedule, epoch):
+    """Image size of the last schedule entry starting at or before this epoch"""
+    current = schedule[0][1]
+    for start, size in schedule:
+        if start > epoch:
+            break
+        current = size
+    return current
+
+class SharedSize:
+    """Image size kept in shared memory, so persistent DataLoader workers see changes without a respawn"""
+    
+    def __init__(self, size):
+        self._value = torch.tensor([size], dtype=torch.int32).share_memory_()
+    
+    def get(self):
+        return int(self._value[0])
+    
+    def set(self, size):
+        self._value[0] = size
+
+class DynamicRandomResizedCrop(transforms.RandomResizedCrop):
+    """RandomResizedCrop whose output size follows a SharedSize"""
+    
+    def __init__(self, shared_size, **kwargs):
+        super().__init__(shared_size.get(), **kwargs)
+        self.shared_size = shared_size
+    
+    def forward(self, img):
+        size = self.shared_size.get()
+        self.size = (size, size)
+        return super().forward(img)
+
+class DynamicResize(transforms.Resize):
+    """Resize the short side to scale x the shared size (256 for 224)"""
+    
+    def __init__(self, shared_size, scale=1.14):
+        super().__init__(int(shared_size.get() * scale))
+        self.shared_size = shared_size
+        self.scale = scale
+    
+    def forward(self, img):
+        self.size = int(self.shared_size.get() * self.scale)
+        return super().forward(img)
+
+class DynamicCenterCrop(transforms.CenterCrop):
+    """CenterCrop whose output size follows a SharedSize"""
+    
+    def __init__(self, shared_size):
+        super().__init__(shared_size.get())
+        self.shared_size = shared_size
+    
+    def forward(self, img):
+        size = self.shared_size.get()
+        self.size = (size, size)
+        return super().forward(img)
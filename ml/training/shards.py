@@ -0,0 +1,139 @@
+import argparse
+import json
+import os
+from multiprocessing import Pool
+
+import numpy as np
+from PIL import Image
+from torch.utils.data import Dataset
+from torchvision import datasets
+from tqdm import tqdm
+
+INDEX_DTYPE = np.dtype([
+    ('shard', np.int32),
+    ('offset', np.int64),
+    ('height', np.int32),
+    ('width', np.int32),
+    ('label', np.int32)
+])
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image-dir", type=str, required=True, help="ImageFolder root (one folder per breed)")
+    parser.add_argument("--output-dir", type=str, required=True)
+    parser.add_argument("--short-side", type=int, default=256)
+    parser.add_argument("--shard-size-mb", type=int, default=1024)
+    parser.add_argument("--num-workers", type=int, default=os.cpu_count())
+    return parser.parse_args()
+
+def load_resized(path, short_side):
+    """Decode an image and shrink its short side to short_side (never upscales)"""
+    with Image.open(path) as img:
+        # Let the JPEG decoder skip detail we are about to throw away
+        img.draft('RGB', (short_side, short_side))
+        img = img.convert('RGB')
+        
+        scale = short_side / min(img.size)
+        if scale < 1:
+            new_size = (max(short_side, round(img.width * scale)), max(short_side, round(img.height * scale)))
+            img = img.resize(new_size, Image.BILINEAR, reducing_gap=3.0)
+        
+        return np.asarray(img, dtype=np.uint8)
+
+def _load_sample(job):
+    path, label, short_side = job
+    return load_resized(path, short_side), label
+
+def pack_shards(image_dir, output_dir, short_side=256, shard_size_mb=1024, num_workers=None):
+    """Decode every image once and write resized uint8 pixels into shard files"""
+    # ImageFolder only scans here; its loader is never called
+    folder = datasets.ImageFolder(image_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    
+    index = np.zeros(len(folder.samples), dtype=INDEX_DTYPE)
+    shard_limit = shard_size_mb * 2**20
+    shard_id = 0
+    offset = 0
+    shard_file = open(os.path.join(output_dir, f"shard_{shard_id:05d}.bin"), 'wb')
+    
+    jobs = [(path, label, short_side) for path, label in folder.samples]
+    with Pool(num_workers) as pool:
+        results = pool.imap(_load_sample, jobs, chunksize=16)
+        for i, (pixels, label) in enumerate(tqdm(results, total=len(jobs), desc="Packing")):
+            if offset > 0 and offset + pixels.nbytes > shard_limit:
+                shard_file.close()
+                shard_id += 1
+                offset = 0
+                shard_file = open(os.path.join(output_dir, f"shard_{shard_id:05d}.bin"), 'wb')
+            
+            shard_file.write(pixels.tobytes())
+            index[i] = (shard_id, offset, pixels.shape[0], pixels.shape[1], label)
+            offset += pixels.nbytes
+    shard_file.close()
+    
+    np.save(os.path.join(output_dir, "index.npy"), index)
+    with open(os.path.join(output_dir, "meta.json"), 'w') as f:
+        json.dump({
+            'classes': folder.classes,
+            'short_side': short_side,
+            'num_shards': shard_id + 1,
+            'num_samples': len(index),
+            'source': os.path.abspath(image_dir)
+        }, f, indent=2)
+    
+    return len(index), shard_id + 1
+
+class ShardDataset(Dataset):
+    """ImageFolder replacement reading pre-decoded pixels from memory-mapped shards"""
+    
+    def __init__(self, shard_dir, transform=None):
+        self.shard_dir = shard_dir
+        self.transform = transform
+        
+        with open(os.path.join(shard_dir, "meta.json"), 'r') as f:
+            meta = json.load(f)
+        self.classes = meta['classes']
+        self.class_to_idx = {name: idx for idx, name in enumerate(self.classes)}
+        self.num_shards = meta['num_shards']
+        
+        self.index = np.load(os.path.join(shard_dir, "index.npy"))
+        self.targets = self.index['label'].tolist()
+        
+        # Opened lazily so each DataLoader worker maps the files itself
+        self._shards = None
+    
+    def __len__(self):
+        return len(self.index)
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_shards'] = None
+        return state
+    
+    def pixels(self, idx):
+        """HxWx3 uint8 view into the shard (no copy)"""
+        if self._shards is None:
+            self._shards = [
+                np.memmap(os.path.join(self.shard_dir, f"shard_{i:05d}.bin"), dtype=np.uint8, mode='r')
+                for i in range(self.num_shards)
+            ]
+        entry = self.index[idx]
+        size = int(entry['height']) * int(entry['width']) * 3
+        flat = self._shards[entry['shard']][entry['offset']:entry['offset'] + size]
+        return flat.reshape(entry['height'], entry['width'], 3)
+    
+    def __getitem__(self, idx):
+        image = Image.fromarray(self.pixels(idx))
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, self.targets[idx]
+
+def main():
+    args = parse_args()
+    num_samples, num_shards = pack_shards(
+        args.image_dir, args.output_dir, args.short_side, args.shard_size_mb, args.num_workers
+    )
+    print(f"📦 Packed {num_samples} images into {num_shards} shard(s) at {args.output_dir}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,177 @@
+import json
+import threading
+
+import numpy as np
+
+STORAGE_DTYPES = ('float32', 'float16', 'int8')
+
+def quantize_int8(vectors):
+    """Symmetric per-row int8 codes and the float32 scales that map them back"""
+    scale = np.abs(vectors).max(axis=1, keepdims=True) / 127
+    scale[scale == 0] = 1
+    return np.round(vectors / scale).astype(np.int8), scale.astype(np.float32)
+
+def save_embeddings(base, vectors, labels, ids, classes, dtype='float16'):
+    """Write base.npy (plus base_scale.npy for int8) and base.json with labels, ids and classes"""
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError(f"Unsupported embedding dtype: {dtype}")
+    if dtype == 'int8':
+        codes, scale = quantize_int8(vectors)
+        np.save(base + "_scale.npy", scale)
+    else:
+        codes = vectors.astype(dtype)
+    np.save(base + ".npy", codes)
+    
+    # Metadata last: its presence marks the matrix as complete
+    with open(base + ".json", 'w') as f:
+        json.dump({
+            'dtype': dtype,
+            'dim': int(vectors.shape[1]),
+            'classes': classes,
+            'labels': [int(label) for label in labels],
+            'ids': list(ids)
+        }, f)
+    return base
+
+def load_embeddings(base):
+    """float32 (N, D) matrix and metadata written by save_embeddings"""
+    with open(base + ".json", 'r') as f:
+        meta = json.load(f)
+    vectors = np.load(base + ".npy").astype(np.float32)
+    if meta['dtype'] == 'int8':
+        vectors *= np.load(base + "_scale.npy")
+    return vectors, meta
+
+def spherical_kmeans(vectors, k, iterations=20, seed=0):
+    """Unit-norm centroids of k clusters under cosine similarity"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = (vectors @ centroids.T).argmax(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        # Empty clusters keep their previous centroid
+        filled = np.bincount(assignments, minlength=k) > 0
+        centroids[filled] = sums[filled] / np.linalg.norm(sums[filled], axis=1, keepdims=True)
+    return centroids
+
+def top_k(scores, k):
+    """Indices of the k largest scores, best first"""
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+class SimilarityIndex:
+    """In-memory nearest-neighbour index over L2-normalized image embeddings
+    
+    Exact search is one matrix product against every stored vector. With nlist > 0, train()
+    clusters the vectors into an inverted file and each query only scores the nprobe closest
+    clusters, which scans roughly nprobe / nlist of the index at a small cost in recall.
+    """
+    
+    def __init__(self, dim, classes, nlist=0, nprobe=8, capacity=1024):
+        self.dim = dim
+        self.classes = classes
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.ids = []
+        
+        self._vectors = np.empty((capacity, dim), dtype=np.float32)
+        self._labels = np.empty(capacity, dtype=np.int64)
+        self._size = 0
+        self._centroids = None
+        self._lists = None
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return self._size
+    
+    @classmethod
+    def load(cls, base, nlist=0, nprobe=8):
+        """Build an index from an embeddings.py matrix file, clustering it when nlist > 0"""
+        vectors, meta = load_embeddings(base)
+        index = cls(meta['dim'], meta['classes'], nlist, nprobe, capacity=max(1024, 2 * len(vectors)))
+        index.add(vectors, meta['labels'], meta['ids'])
+        if nlist > 0:
+            index.train()
+        return index
+    
+    def save(self, base, dtype='float16'):
+        """Persist the index contents, including incremental adds"""
+        with self._lock:
+            size = self._size
+        return save_embeddings(base, self._vectors[:size], self._labels[:size], self.ids[:size], self.classes, dtype)
+    
+    def add(self, vectors, labels=None, ids=None):
+        """Append normalized embeddings, e.g. new user photos; label -1 marks an unknown breed"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        labels = np.full(len(vectors), -1) if labels is None else np.asarray(labels, dtype=np.int64)
+        
+        with self._lock:
+            start, end = self._size, self._size + len(vectors)
+            if ids is None:
+                ids = [str(i) for i in range(start, end)]
+            
+            # Grow by doubling into new arrays, so searches holding the old ones stay valid
+            if end > len(self._vectors):
+                capacity = max(end, 2 * len(self._vectors))
+                grown_vectors = np.empty((capacity, self.dim), dtype=np.float32)
+                grown_vectors[:start] = self._vectors[:start]
+                grown_labels = np.empty(capacity, dtype=np.int64)
+                grown_labels[:start] = self._labels[:start]
+                self._vectors, self._labels = grown_vectors, grown_labels
+            
+            self._vectors[start:end] = vectors
+            self._labels[start:end] = labels
+            self.ids.extend(ids)
+            
+            if self._centroids is not None:
+                assignments = (vectors @ self._centroids.T).argmax(axis=1)
+                lists = list(self._lists)
+                for c in np.unique(assignments):
+                    lists[c] = np.concatenate([lists[c], start + np.flatnonzero(assignments == c)])
+                self._lists = lists
+            self._size = end
+    
+    def train(self, iterations=20):
+        """Cluster the stored vectors into nlist inverted lists for approximate search"""
+        with self._lock:
+            vectors = self._vectors[:self._size]
+            nlist = min(self.nlist, self._size)
+            centroids = spherical_kmeans(vectors, nlist, iterations)
+            assignments = (vectors @ centroids.T).argmax(axis=1)
+            self._lists = [np.flatnonzero(assignments == c) for c in range(nlist)]
+            self._centroids = centroids
+    
+    def search(self, queries, k=5):
+        """k nearest stored images per query row as [{'id', 'breed', 'similarity'}, ...]"""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        # Rows below size are never rewritten, so the scan itself needs no lock
+        with self._lock:
+            size = self._size
+            vectors = self._vectors[:size]
+            labels = self._labels[:size]
+            centroids, lists = self._centroids, self._lists
+        
+        if centroids is None:
+            all_scores = queries @ vectors.T
+        
+        results = []
+        for q, query in enumerate(queries):
+            if centroids is None:
+                rows, scores = np.arange(size), all_scores[q]
+            else:
+                probe = top_k(centroids @ query, self.nprobe)
+                rows = np.concatenate([lists[c] for c in probe])
+                scores = vectors[rows] @ query
+            results.append([
+                {
+                    'id': self.ids[rows[i]],
+                    'breed': self.classes[labels[rows[i]]] if labels[rows[i]] >= 0 else None,
+                    'similarity': float(scores[i])
+                }
+                for i in top_k(scores, k)
+            ])
+        return results
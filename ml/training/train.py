@@ -1,24 +1,50 @@
 import os
 import json
+import math
 import argparse
+import builtins
+from contextlib import nullcontext
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+import torch.distributed as dist
 from torchvision import transforms, datasets, models
 from torch.utils.data import DataLoader
-from torch.amp import autocast, GradScaler
+from torch.utils.data.distributed import DistributedSampler
+from torch.nn.parallel import DistributedDataParallel
 from tqdm import tqdm
 import numpy as np
 
+from shards import ShardDataset
+from gpu_augment import BatchAugment
+from profiler import StepProfiler
+from precision import resolve_precision, autocast_context, make_grad_scaler, to_channels_last
+from autobatch import find_max_batch_size
+from val_cache import CachedValidationSet, build_val_cache, val_cache_path
+from resolution import (PROGRESSIVE_SCHEDULE, SharedSize, DynamicRandomResizedCrop, DynamicResize,
+                        DynamicCenterCrop, parse_resize_schedule, size_for_epoch)
+from distill import (DistillationLoss, IndexedDataset, compare_with_teacher, load_teacher_logits,
+                     precompute_teacher_logits, teacher_logits_path)
+from checkpoint import AsyncCheckpointer, ResumableSampler, load_latest_checkpoint, get_rng_state, set_rng_state
+
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("--model-dir", type=str, default=os.environ.get("SM_MODEL_DIR", "./model"))
     parser.add_argument("--train", type=str, default=os.environ.get("SM_CHANNEL_TRAIN", "./data/train"))
     parser.add_argument("--validation", type=str, default=os.environ.get("SM_CHANNEL_VALIDATION", "./data/validation"))
+    parser.add_argument("--train-shards", type=str, default=None, help="Packed shard dir used instead of --train")
+    parser.add_argument("--validation-shards", type=str, default=None, help="Packed shard dir used instead of --validation")
     parser.add_argument("--output-data-dir", type=str, default=os.environ.get("SM_OUTPUT_DATA_DIR", "./output"))
     parser.add_argument("--epochs", type=int, default=40)
-    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=32, help="Micro-batch per step (per rank under DDP)")
+    parser.add_argument("--grad-accum-steps", type=int, default=1,
+                       help="Micro-batches per optimizer step; effective batch = batch-size x grad-accum-steps")
+    parser.add_argument("--auto-batch-size", action='store_true',
+                       help="Probe the largest micro-batch that fits at each image size, keeping the effective batch")
     parser.add_argument("--lr", type=float, default=0.0003)
+    parser.add_argument("--scale-lr", action='store_true',
+                       help="Linear scaling rule: lr x global effective batch / --lr-base-batch")
+    parser.add_argument("--lr-base-batch", type=int, default=32, help="Batch size --lr was tuned for")
     parser.add_argument("--num-workers", type=int, default=4)
     parser.add_argument("--patience", type=int, default=10)
     
@@ -26,15 +52,98 @@ def parse_args():
     parser.add_argument("--mixup-alpha", type=float, default=0.6, help="Stronger mixup")
     parser.add_argument("--cutmix-alpha", type=float, default=1.2, help="Stronger cutmix")
     parser.add_argument("--mixup-prob", type=float, default=0.7, help="More frequent augmentation")
+    parser.add_argument("--gpu-augment", action='store_true',
+                       help="Workers only decode and crop; remaining augmentation runs batched on the device")
     
     # Model architecture
     parser.add_argument("--model", type=str, default="efficientnet_b1", 
-                       choices=["efficientnet_b0", "efficientnet_b1", "efficientnet_b2"])
+                       choices=["efficientnet_b0", "efficientnet_b1", "efficientnet_b2",
+                                "mobilenet_v3_small", "mobilenet_v3_large"])
+    
+    # Knowledge distillation: --model is the student, soft targets come from a trained teacher
+    parser.add_argument("--teacher-dir", type=str, default=None,
+                       help="Model dir of a trained teacher (e.g. efficientnet_b2); enables distillation")
+    parser.add_argument("--distill-alpha", type=float, default=0.7, help="Weight of the soft-target loss")
+    parser.add_argument("--distill-temperature", type=float, default=4.0)
+    parser.add_argument("--teacher-cache-dir", type=str, default=None,
+                       help="Where teacher logits are cached (default: <output-data-dir>/teacher_logits)")
     
     # Progressive training
     parser.add_argument("--progressive-resize", action='store_true', help="Start with 192px, end with 224px")
-    
-    return parser.parse_args()
+    parser.add_argument("--resize-schedule", type=str, default=None,
+                       help="Per-epoch sizes as epoch:size pairs, e.g. 0:160,4:176,8:192,14:208,20:224")
+    
+    # Numerics and kernels
+    parser.add_argument("--precision", type=str, default="auto", choices=["auto", "fp32", "fp16", "bf16"],
+                       help="Autocast dtype; auto is fp16 on CUDA and fp32 on CPU")
+    parser.add_argument("--channels-last", action='store_true', help="NHWC memory format for model and batches")
+    parser.add_argument("--compile", action='store_true', help="torch.compile the model (PyTorch >= 2.0)")
+    
+    # Distributed training (launched via torchrun, which sets RANK/WORLD_SIZE/LOCAL_RANK)
+    parser.add_argument("--dist-backend", type=str, default=None, choices=["nccl", "gloo"],
+                       help="Defaults to nccl on GPU and gloo on CPU")
+    
+    # Validation pre-cropped once per resolution instead of decoded every epoch
+    parser.add_argument("--val-cache-dir", type=str, default=None,
+                       help="Cache validation pixels here as uint8 arrays (moved to the GPU when they fit)")
+    parser.add_argument("--val-batch-size", type=int, default=256, help="Eval batch size with --val-cache-dir")
+    
+    # Spot-instance resume: full training state saved periodically and reloaded on start-up
+    parser.add_argument("--checkpoint-dir", type=str, default=None,
+                       help="Local dir for resumable checkpoints (SageMaker syncs /opt/ml/checkpoints to S3)")
+    parser.add_argument("--checkpoint-every", type=int, default=200,
+                       help="Save every N training steps; 0 saves only at the end of each epoch")
+    parser.add_argument("--keep-checkpoints", type=int, default=2)
+    
+    parser.add_argument("--clip-grad-norm", type=float, default=1.0, help="0 disables gradient clipping")
+    parser.add_argument("--log-every", type=int, default=50,
+                       help="Sync loss/accuracy to the progress bar every N steps; 0 only at epoch end")
+    
+    # Instrumentation: per-stage step timings written to the output data dir
+    parser.add_argument("--profile", action='store_true',
+                       help="Record data wait/H2D/forward/backward/clip/optimizer timings (syncs the device each stage)")
+    parser.add_argument("--profile-trace-steps", type=int, default=0,
+                       help="With --profile, also capture a torch.profiler trace of this many steps in the first epoch")
+    
+    # Serving artifacts written after training
+    parser.add_argument("--export", type=str, nargs='*', default=[], choices=["torchscript", "onnx"],
+                       help="Export the best model for optimized CPU serving")
+    
+    args = parser.parse_args()
+    # The trace window is driven by the profiler's step hooks, which --profile turns on
+    if args.profile_trace_steps and not args.profile:
+        parser.error("--profile-trace-steps requires --profile")
+    return args
+
+def init_distributed(args):
+    """Join the torchrun process group; returns (rank, world_size, local_rank)"""
+    world_size = int(os.environ.get("WORLD_SIZE", 1))
+    if world_size <= 1:
+        return 0, 1, 0
+    
+    rank = int(os.environ["RANK"])
+    local_rank = int(os.environ.get("LOCAL_RANK", 0))
+    backend = args.dist_backend or ("nccl" if torch.cuda.is_available() else "gloo")
+    if torch.cuda.is_available():
+        torch.cuda.set_device(local_rank)
+    dist.init_process_group(backend=backend)
+    
+    # Only rank 0 prints
+    if rank != 0:
+        builtins.print = lambda *a, **k: None
+    
+    return rank, world_size, local_rank
+
+def is_main_process():
+    return not dist.is_initialized() or dist.get_rank() == 0
+
+def reduce_metrics(loss_sum, num_batches, correct, total, device):
+    """Sum epoch metrics over all ranks; returns (mean loss, accuracy %)"""
+    if dist.is_initialized():
+        metrics = torch.tensor([loss_sum, num_batches, correct, total], dtype=torch.float64, device=device)
+        dist.all_reduce(metrics, op=dist.ReduceOp.SUM)
+        loss_sum, num_batches, correct, total = metrics.tolist()
+    return loss_sum / num_batches, 100. * correct / total
 
 def mixup_data(x, y, alpha=0.6):
     """Apply Mixup augmentation with stronger mixing"""
@@ -104,6 +213,11 @@ def build_model(num_classes, model_name="efficientnet_b1"):
     elif model_name == "efficientnet_b2":
         model = models.efficientnet_b2(weights='IMAGENET1K_V1')
         dropout = 0.5
+    elif model_name in ("mobilenet_v3_small", "mobilenet_v3_large"):
+        # Small distillation students: keep the pretrained hidden layer, resize only the output
+        model = getattr(models, model_name)(weights='IMAGENET1K_V1')
+        model.classifier[-1] = nn.Linear(model.classifier[-1].in_features, num_classes)
+        return model
     
     in_features = model.classifier[1].in_features
     model.classifier = nn.Sequential(
@@ -113,141 +227,237 @@ def build_model(num_classes, model_name="efficientnet_b1"):
     
     return model
 
-def get_data_loaders(train_dir, val_dir, batch_size, num_workers, img_size=224, progressive=False, epoch=0):
-    """Create data loaders with optional progressive resizing"""
-    
-    # Progressive resizing: start smaller, grow to full size
-    if progressive:
-        if epoch < 10:
-            current_size = 192
-        elif epoch < 20:
-            current_size = 208
-        else:
-            current_size = 224
+def get_resize_schedule(args, img_size=224):
+    """[(start epoch, image size), ...] from --resize-schedule or --progressive-resize"""
+    if args.resize_schedule:
+        return parse_resize_schedule(args.resize_schedule)
+    if args.progressive_resize:
+        return PROGRESSIVE_SCHEDULE
+    return [(0, img_size)]
+
+def get_data_loaders(train_dir, val_dir, batch_size, num_workers, img_size=224,
+                     train_shards=None, val_shards=None, gpu_augment=False, distributed=False, indexed=False):
+    """Create data loaders whose image size and batch size can change between epochs
+    
+    Returns the loaders, the class names and the SharedSize that drives both loaders' transforms.
+    With indexed, train batches carry dataset indices instead of labels (for distillation).
+    """
+    image_size = SharedSize(img_size)
+    print(f"Using image size: {img_size}x{img_size}")
+    
+    train_transform, val_transform = get_transforms(image_size, gpu_augment)
+    
+    # Pre-decoded shards skip JPEG decoding entirely; fall back to the image folders
+    if train_shards:
+        train_dataset = ShardDataset(train_shards, transform=train_transform)
+    else:
+        train_dataset = datasets.ImageFolder(train_dir, transform=train_transform)
+    if val_shards:
+        val_dataset = ShardDataset(val_shards, transform=val_transform)
     else:
-        current_size = img_size
+        val_dataset = datasets.ImageFolder(val_dir, transform=val_transform)
+    if indexed:
+        train_dataset = IndexedDataset(train_dataset)
+    
+    # Each rank sees its own shard of the data; batch_size is per rank.
+    # The train order is seeded per epoch so a resumed run can skip the batches it already saw.
+    # Workers persist across epochs; resolution changes reach them through image_size.
+    if distributed:
+        train_sampler = ResumableSampler(train_dataset, shuffle=True, drop_last=True)
+    else:
+        train_sampler = ResumableSampler(train_dataset, num_replicas=1, rank=0, shuffle=True)
+    val_sampler = DistributedSampler(val_dataset, shuffle=False) if distributed else None
     
-    print(f"Using image size: {current_size}x{current_size}")
+    persistent = num_workers > 0
+    train_loader = DataLoader(train_dataset, batch_size=batch_size, sampler=train_sampler,
+                             num_workers=num_workers, pin_memory=True, drop_last=True,
+                             persistent_workers=persistent)
+    val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False,
+                           sampler=val_sampler, num_workers=num_workers, pin_memory=True,
+                           persistent_workers=persistent)
+    
+    return train_loader, val_loader, train_dataset.classes, image_size
+
+def set_batch_size(loader, batch_size):
+    """Change a loader's batch size in place; batches are formed in the main process, so workers are unaffected"""
+    loader.batch_sampler.batch_size = batch_size
+
+def get_transforms(current_size, gpu_augment=False):
+    """Train/validation transforms for the given image size (an int or a SharedSize)"""
+    if not isinstance(current_size, SharedSize):
+        current_size = SharedSize(current_size)
     
     # More aggressive augmentation
-    train_transform = transforms.Compose([
-        transforms.RandomResizedCrop(current_size, scale=(0.6, 1.0)),  # Even more aggressive
-        transforms.RandomHorizontalFlip(),
-        transforms.RandomRotation(25),  # Increased rotation
-        transforms.ColorJitter(brightness=0.4, contrast=0.4, saturation=0.4, hue=0.15),  # Stronger
-        transforms.RandomAffine(degrees=0, translate=(0.15, 0.15), shear=10),  # Added shear
-        transforms.RandomGrayscale(p=0.15),  # More frequent
-        transforms.RandomPerspective(distortion_scale=0.2, p=0.3),  # Added perspective
-        transforms.ToTensor(),
-        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
-        transforms.RandomErasing(p=0.2, scale=(0.02, 0.15))  # Random erasing
-    ])
+    if gpu_augment:
+        # Everything after the crop is applied per batch by BatchAugment in train_epoch
+        train_transform = transforms.Compose([
+            DynamicRandomResizedCrop(current_size, scale=(0.6, 1.0)),
+            transforms.PILToTensor()
+        ])
+    else:
+        train_transform = transforms.Compose([
+            DynamicRandomResizedCrop(current_size, scale=(0.6, 1.0)),  # Even more aggressive
+            transforms.RandomHorizontalFlip(),
+            transforms.RandomRotation(25),  # Increased rotation
+            transforms.ColorJitter(brightness=0.4, contrast=0.4, saturation=0.4, hue=0.15),  # Stronger
+            transforms.RandomAffine(degrees=0, translate=(0.15, 0.15), shear=10),  # Added shear
+            transforms.RandomGrayscale(p=0.15),  # More frequent
+            transforms.RandomPerspective(distortion_scale=0.2, p=0.3),  # Added perspective
+            transforms.ToTensor(),
+            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
+            transforms.RandomErasing(p=0.2, scale=(0.02, 0.15))  # Random erasing
+        ])
     
     val_transform = transforms.Compose([
-        transforms.Resize(int(current_size * 1.14)),  # 256 for 224
-        transforms.CenterCrop(current_size),
+        DynamicResize(current_size, scale=1.14),  # 256 for 224
+        DynamicCenterCrop(current_size),
         transforms.ToTensor(),
         transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
     ])
     
-    train_dataset = datasets.ImageFolder(train_dir, transform=train_transform)
-    val_dataset = datasets.ImageFolder(val_dir, transform=val_transform)
-    
-    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True,
-                             num_workers=num_workers, pin_memory=True, drop_last=True)
-    val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False,
-                           num_workers=num_workers, pin_memory=True)
-    
-    return train_loader, val_loader, train_dataset.classes
+    return train_transform, val_transform
 
-def train_epoch(model, train_loader, criterion, optimizer, scaler, device, args, epoch):
-    """Train with advanced mixup/cutmix"""
+def train_epoch(model, train_loader, criterion, optimizer, scaler, device, args, epoch,
+                progress=None, on_step=None, profiler=None, accum_steps=1):
+    """Train with advanced mixup/cutmix
+    
+    Gradients are accumulated over accum_steps micro-batches per optimizer step.
+    progress carries the step count and running metrics of a partially finished epoch when resuming;
+    on_step is called with the same dict after every optimizer step.
+    """
+    profiler = profiler or StepProfiler(device)
     model.train()
-    running_loss = 0.0
-    correct = 0
-    total = 0
-    
-    for images, labels in tqdm(train_loader, desc="Training"):
-        images, labels = images.to(device), labels.to(device)
+    progress = progress or {'step': 0, 'loss_sum': 0.0, 'correct': 0, 'total': 0}
+    step = progress['step']
+    # Loss and correct counts stay on the device; reading them back every step would sync the GPU
+    running_loss = torch.as_tensor(progress['loss_sum'], dtype=torch.float32).to(device)
+    correct = torch.as_tensor(progress['correct'], dtype=torch.float32).to(device)
+    total = progress['total']
+    batch_augment = BatchAugment() if args.gpu_augment else None
+    # Distillation targets are dataset indices; the criterion maps them back to labels
+    label_of = getattr(criterion, 'label_of', lambda targets: targets)
+    
+    num_batches = len(train_loader)
+    pbar = tqdm(train_loader, desc="Training", disable=not is_main_process())
+    profiler.start("train", epoch)
+    for i, (images, labels) in enumerate(profiler.iterate(pbar)):
+        # The last window of the epoch may hold fewer micro-batches
+        window_start = i - i % accum_steps
+        window_size = min(accum_steps, num_batches - window_start)
+        last_in_window = i + 1 == window_start + window_size
         
-        # Higher probability of mixup/cutmix
-        use_augmentation = np.random.rand() < args.mixup_prob
+        with profiler.stage("h2d"):
+            images = images.to(device, non_blocking=True)
+            labels = labels.to(device, non_blocking=True)
         
-        if use_augmentation:
-            if np.random.rand() < 0.5:
-                images, labels_a, labels_b, lam = mixup_data(images, labels, args.mixup_alpha)
-            else:
-                images, labels_a, labels_b, lam = cutmix_data(images, labels, args.cutmix_alpha)
+        with profiler.stage("augment"):
+            if batch_augment is not None:
+                images = batch_augment(images)
             
-            optimizer.zero_grad()
-            
-            with autocast('cuda'):
+            # Higher probability of mixup/cutmix
+            use_augmentation = np.random.rand() < args.mixup_prob
+            if use_augmentation:
+                if np.random.rand() < 0.5:
+                    images, labels_a, labels_b, lam = mixup_data(images, labels, args.mixup_alpha)
+                else:
+                    images, labels_a, labels_b, lam = cutmix_data(images, labels, args.cutmix_alpha)
+            images = to_channels_last(images, args.channels_last)
+        
+        if i == window_start:
+            with profiler.stage("optimizer"):
+                optimizer.zero_grad(set_to_none=True)
+        
+        # DDP only needs to all-reduce gradients on the last micro-batch of a window
+        # hasattr rather than isinstance: a compiled DDP model forwards no_sync to the wrapper
+        no_sync = model.no_sync() if hasattr(model, 'no_sync') and not last_in_window else nullcontext()
+        with no_sync:
+            with profiler.stage("forward"), autocast_context(device, args.precision):
                 outputs = model(images)
-                loss = mixup_criterion(criterion, outputs, labels_a, labels_b, lam)
-            
-            scaler.scale(loss).backward()
+                if use_augmentation:
+                    loss = mixup_criterion(criterion, outputs, labels_a, labels_b, lam)
+                else:
+                    loss = criterion(outputs, labels)
             
+            with profiler.stage("backward"):
+                scaler.scale(loss / window_size).backward()
+        
+        if last_in_window:
             # Gradient clipping for stability
-            scaler.unscale_(optimizer)
-            torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
+            if args.clip_grad_norm > 0:
+                with profiler.stage("clip_grad"):
+                    scaler.unscale_(optimizer)
+                    torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=args.clip_grad_norm)
             
-            scaler.step(optimizer)
-            scaler.update()
-            
-            running_loss += loss.item()
-            _, predicted = outputs.max(1)
-            total += labels.size(0)
-            correct += (lam * predicted.eq(labels_a).sum().item() + 
-                       (1 - lam) * predicted.eq(labels_b).sum().item())
+            with profiler.stage("optimizer"):
+                scaler.step(optimizer)
+                scaler.update()
+        
+        running_loss += loss.detach()
+        predicted = outputs.detach().argmax(1)
+        total += labels.size(0)
+        if use_augmentation:
+            correct += lam * predicted.eq(label_of(labels_a)).sum() + (1 - lam) * predicted.eq(label_of(labels_b)).sum()
         else:
-            optimizer.zero_grad()
-            
-            with autocast('cuda'):
-                outputs = model(images)
-                loss = criterion(outputs, labels)
-            
-            scaler.scale(loss).backward()
-            scaler.unscale_(optimizer)
-            torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
-            scaler.step(optimizer)
-            scaler.update()
-            
-            running_loss += loss.item()
-            _, predicted = outputs.max(1)
-            total += labels.size(0)
-            correct += predicted.eq(labels).sum().item()
-    
-    return running_loss / len(train_loader), 100. * correct / total
+            correct += predicted.eq(label_of(labels)).sum()
+        
+        step += 1
+        if args.log_every and step % args.log_every == 0:
+            pbar.set_postfix(loss=f"{running_loss.item() / step:.4f}", acc=f"{100. * correct.item() / total:.2f}%")
+        if on_step is not None and last_in_window:
+            with profiler.stage("checkpoint"):
+                on_step({'step': step, 'loss_sum': running_loss, 'correct': correct, 'total': total})
+        profiler.step(labels.size(0))
+    profiler.stop()
+    
+    return reduce_metrics(running_loss.item(), step, correct.item(), total, device)
 
-def validate(model, val_loader, criterion, device):
+def validate(model, val_loader, criterion, device, profiler=None, epoch=0, precision='fp32', channels_last=False):
     """Standard validation"""
+    profiler = profiler or StepProfiler(device)
     model.eval()
-    running_loss = 0.0
-    correct = 0
+    running_loss = torch.zeros((), device=device)
+    correct = torch.zeros((), dtype=torch.long, device=device)
     total = 0
     
     with torch.no_grad():
-        for images, labels in tqdm(val_loader, desc="Validation"):
-            images, labels = images.to(device), labels.to(device)
-            outputs = model(images)
-            loss = criterion(outputs, labels)
+        profiler.start("validation", epoch)
+        for images, labels in profiler.iterate(tqdm(val_loader, desc="Validation", disable=not is_main_process())):
+            with profiler.stage("h2d"):
+                images = images.to(device, non_blocking=True)
+                labels = labels.to(device, non_blocking=True)
+                images = to_channels_last(images, channels_last)
+            with profiler.stage("forward"), autocast_context(device, precision):
+                outputs = model(images)
+                loss = criterion(outputs, labels)
             
-            running_loss += loss.item()
-            _, predicted = outputs.max(1)
+            running_loss += loss
             total += labels.size(0)
-            correct += predicted.eq(labels).sum().item()
+            correct += outputs.argmax(1).eq(labels).sum()
+            profiler.step(labels.size(0))
+        profiler.stop()
     
-    return running_loss / len(val_loader), 100. * correct / total
+    return reduce_metrics(running_loss.item(), len(val_loader), correct.item(), total, device)
 
 def main():
     args = parse_args()
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    rank, world_size, local_rank = init_distributed(args)
+    distributed = world_size > 1
+    device = torch.device(f"cuda:{local_rank}" if torch.cuda.is_available() else "cpu")
     print(f"Using device: {device}")
+    if distributed:
+        print(f"Distributed: {world_size} processes ({dist.get_backend()})")
+    
+    # Every rank reads the same file so they all resume at the same position
+    resume_state = load_latest_checkpoint(args.checkpoint_dir)
+    start_epoch = resume_state['epoch'] if resume_state else 0
     
-    # Initial data loaders
-    train_loader, val_loader, classes = get_data_loaders(
+    # Built once; image size and batch size are updated in place when the schedule moves on
+    resize_schedule = get_resize_schedule(args)
+    train_loader, val_loader, classes, image_size = get_data_loaders(
         args.train, args.validation, args.batch_size, args.num_workers,
-        progressive=args.progressive_resize, epoch=0
+        img_size=size_for_epoch(resize_schedule, start_epoch),
+        train_shards=args.train_shards, val_shards=args.validation_shards,
+        gpu_augment=args.gpu_augment, distributed=distributed, indexed=bool(args.teacher_dir)
     )
     
     print(f"Training samples: {len(train_loader.dataset)}")
@@ -255,15 +465,83 @@ def main():
     print(f"Number of classes: {len(classes)}")
     print(f"Samples per class: {len(train_loader.dataset) / len(classes):.1f}")
     
+    args.precision = resolve_precision(args.precision, device)
+    print(f"Precision: {args.precision}, channels_last: {args.channels_last}, compile: {args.compile}")
+    
     model = build_model(len(classes), args.model).to(device)
+    if args.channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    if distributed:
+        model = DistributedDataParallel(model, device_ids=[local_rank] if device.type == "cuda" else None)
+    # Underlying module for checkpoints, without the DDP wrapper's "module." prefix
+    model_without_ddp = model.module if distributed else model
+    if args.compile:
+        # Compiled lazily on the first batch; the eager module still owns the parameters
+        model = torch.compile(model)
     
     # Stronger regularization
     criterion = nn.CrossEntropyLoss(label_smoothing=0.2)  # Increased from 0.15
     
+    # Distillation: the teacher runs once over the train set; its cached logits become soft targets.
+    # Validation and batch-size probing keep the plain criterion.
+    train_criterion = criterion
+    if args.teacher_dir:
+        train_dataset = train_loader.dataset.dataset
+        cache_dir = args.teacher_cache_dir or os.path.join(args.output_data_dir, "teacher_logits")
+        logits_path = teacher_logits_path(cache_dir, train_dataset, args.teacher_dir)
+        if rank == 0:
+            precompute_teacher_logits(args.teacher_dir, train_dataset, classes, logits_path, device,
+                                      args.val_batch_size, args.num_workers, args.precision)
+        if distributed:
+            dist.barrier()
+        train_criterion = DistillationLoss(
+            criterion, load_teacher_logits(logits_path), train_dataset.targets,
+            alpha=args.distill_alpha, temperature=args.distill_temperature
+        ).to(device)
+    
+    # Effective batch per rank stays fixed; --auto-batch-size only trades micro-batch for accumulation steps
+    target_batch = args.batch_size * args.grad_accum_steps
+    lr = args.lr
+    if args.scale_lr:
+        lr = args.lr * target_batch * world_size / args.lr_base_batch
+        print(f"LR scaled to {lr:.6f} for global batch {target_batch * world_size}")
+    
+    def plan_batches(img_size):
+        """(micro-batch, accumulation steps) for this image size"""
+        if not args.auto_batch_size:
+            return args.batch_size, args.grad_accum_steps
+        max_batch = find_max_batch_size(model_without_ddp, criterion, device, img_size, len(classes), target_batch,
+                                        precision=args.precision)
+        # Fewest steps that fit, then the smallest micro-batch filling them: micro x steps stays
+        # within steps - 1 of the target (e.g. max 24 for 32 gives 16 x 2, not 24 x 2 = 48)
+        accum_steps = math.ceil(target_batch / max_batch)
+        micro_batch = math.ceil(target_batch / accum_steps)
+        print(f"Auto batch size at {img_size}px: {micro_batch} x {accum_steps} steps = {micro_batch * accum_steps} "
+              f"(target {target_batch}, max fitting {max_batch})")
+        return micro_batch, accum_steps
+    
+    micro_batch, accum_steps = plan_batches(image_size.get())
+    set_batch_size(train_loader, micro_batch)
+    set_batch_size(val_loader, micro_batch)
+    
+    def load_val_data(img_size):
+        """Validation loader, or the cached pixels for this size when --val-cache-dir is set"""
+        if not args.val_cache_dir:
+            return val_loader
+        if rank == 0:
+            build_val_cache(val_loader.dataset, img_size, args.val_cache_dir, args.num_workers)
+        if distributed:
+            dist.barrier()
+        val_data = CachedValidationSet(val_cache_path(args.val_cache_dir, img_size), device, args.val_batch_size)
+        print(f"Validation cached at {img_size}px ({'device' if val_data.on_device else 'memory-mapped'})")
+        return val_data
+    
+    val_data = load_val_data(image_size.get())
+    
     # Use AdamW with higher weight decay
     optimizer = torch.optim.AdamW(
         model.parameters(),
-        lr=args.lr,
+        lr=lr,
         weight_decay=0.08,  # Increased from 0.05
         betas=(0.9, 0.999)
     )
@@ -277,12 +555,70 @@ def main():
         optimizer, T_max=args.epochs - warmup_epochs, eta_min=1e-6
     )
     
-    scaler = GradScaler('cuda')
+    scaler = make_grad_scaler(device, args.precision)
     
     best_acc = 0.0
     best_epoch = 0
     patience_counter = 0
     history = {'train_loss': [], 'train_acc': [], 'val_loss': [], 'val_acc': []}
+    resume_progress = None
+    
+    if resume_state:
+        model_without_ddp.load_state_dict(resume_state['model_state_dict'])
+        optimizer.load_state_dict(resume_state['optimizer_state_dict'])
+        scaler.load_state_dict(resume_state['scaler_state_dict'])
+        scheduler_warmup.load_state_dict(resume_state['scheduler_warmup_state_dict'])
+        scheduler_cosine.load_state_dict(resume_state['scheduler_cosine_state_dict'])
+        set_rng_state(resume_state['rng_state'])
+        best_acc = resume_state['best_acc']
+        best_epoch = resume_state['best_epoch']
+        patience_counter = resume_state['patience_counter']
+        history = resume_state['history']
+        if resume_state['step'] > 0:
+            resume_progress = resume_state['epoch_progress']
+        print(f"Resumed at epoch {start_epoch+1}, step {resume_state['step']} (best {best_acc:.2f}%)")
+        
+        # The run had already early-stopped before the interruption
+        if patience_counter >= args.patience:
+            start_epoch = args.epochs
+        del resume_state
+    
+    # Only rank 0 writes; model/optimizer state is identical across ranks after each step
+    checkpointer = None
+    if args.checkpoint_dir and rank == 0:
+        checkpointer = AsyncCheckpointer(args.checkpoint_dir, keep=args.keep_checkpoints)
+    
+    def training_state(epoch, step, epoch_progress=None):
+        return {
+            'epoch': epoch,
+            'step': step,
+            'epoch_progress': epoch_progress,
+            'model_state_dict': model_without_ddp.state_dict(),
+            'optimizer_state_dict': optimizer.state_dict(),
+            'scaler_state_dict': scaler.state_dict(),
+            'scheduler_warmup_state_dict': scheduler_warmup.state_dict(),
+            'scheduler_cosine_state_dict': scheduler_cosine.state_dict(),
+            'rng_state': get_rng_state(),
+            'best_acc': best_acc,
+            'best_epoch': best_epoch,
+            'patience_counter': patience_counter,
+            'history': history,
+            'classes': classes,
+            'args': vars(args)
+        }
+    
+    profiler = StepProfiler(
+        device, enabled=args.profile,
+        trace_dir=os.path.join(args.output_data_dir, "profiler_trace") if args.profile_trace_steps else None,
+        trace_steps=args.profile_trace_steps
+    )
+    
+    # Called once per optimizer step, so checkpoint_every counts optimizer steps
+    def on_step(progress):
+        if checkpointer is None or not args.checkpoint_every:
+            return
+        if progress['step'] % (args.checkpoint_every * accum_steps) == 0:
+            checkpointer.save(training_state(epoch, progress['step'], progress), epoch, progress['step'])
     
     print("\n" + "="*60)
     print("OPTIMIZED TRAINING")
@@ -292,25 +628,41 @@ def main():
     print(f"CutMix alpha: {args.cutmix_alpha}")
     print(f"Aug probability: {args.mixup_prob}")
     print(f"Label smoothing: 0.2")
+    if args.teacher_dir:
+        print(f"Distillation: teacher {args.teacher_dir}, alpha {args.distill_alpha}, T {args.distill_temperature}")
     print(f"Weight decay: 0.08")
-    print(f"Progressive resize: {args.progressive_resize}")
+    print(f"Resize schedule: {', '.join(f'{size}px from epoch {start + 1}' for start, size in resize_schedule)}")
+    print(f"Batch: {micro_batch} x {accum_steps} accumulation steps x {world_size} ranks")
     print(f"Warmup epochs: {warmup_epochs}")
     print("="*60 + "\n")
     
-    for epoch in range(args.epochs):
+    for epoch in range(start_epoch, args.epochs):
         print(f"\nEpoch [{epoch+1}/{args.epochs}]")
         
-        # Update data loaders if using progressive resizing
-        if args.progressive_resize and epoch in [10, 20]:
-            train_loader, val_loader, _ = get_data_loaders(
-                args.train, args.validation, args.batch_size, args.num_workers,
-                progressive=True, epoch=epoch
-            )
+        # Resolution change: update the shared size the workers read instead of rebuilding the loaders
+        epoch_size = size_for_epoch(resize_schedule, epoch)
+        if epoch_size != image_size.get():
+            image_size.set(epoch_size)
+            print(f"Using image size: {epoch_size}x{epoch_size}")
+            micro_batch, accum_steps = plan_batches(epoch_size)
+            set_batch_size(train_loader, micro_batch)
+            set_batch_size(val_loader, micro_batch)
+            val_data = load_val_data(epoch_size)
+        
+        # Reshuffle every epoch; on resume, skip the batches already trained on
+        train_loader.sampler.set_epoch(epoch)
+        progress, resume_progress = resume_progress, None
+        if progress:
+            train_loader.sampler.skip(progress['total'])
         
         train_loss, train_acc = train_epoch(
-            model, train_loader, criterion, optimizer, scaler, device, args, epoch
+            model, train_loader, train_criterion, optimizer, scaler, device, args, epoch,
+            progress=progress, on_step=on_step, profiler=profiler, accum_steps=accum_steps
+        )
+        val_loss, val_acc = validate(
+            model, val_data, criterion, device, profiler=profiler, epoch=epoch,
+            precision=args.precision, channels_last=args.channels_last
         )
-        val_loss, val_acc = validate(model, val_loader, criterion, device)
         
         # Step scheduler
         if epoch < warmup_epochs:
@@ -330,6 +682,13 @@ def main():
         print(f"Val:   {val_loss:.4f} / {val_acc:.2f}%")
         print(f"Gap:   {overfit_gap:+.2f}%")
         print(f"LR:    {current_lr:.6f}")
+        if args.profile:
+            train_profile, val_profile = profiler.epochs[-2:]
+            print(f"Speed: {train_profile['samples_per_sec']:.1f} / {val_profile['samples_per_sec']:.1f} samples/s")
+            print("Stage: " + ", ".join(f"{name} {t['mean_ms']:.1f}ms" for name, t in train_profile['stages'].items()))
+            # Rewritten every epoch so an interrupted run still leaves its timings behind
+            if rank == 0:
+                profiler.save(args.output_data_dir)
         
         if val_acc > best_acc:
             best_acc = val_acc
@@ -337,26 +696,42 @@ def main():
             patience_counter = 0
             print(f"✨ NEW BEST: {best_acc:.2f}%")
             
-            os.makedirs(args.model_dir, exist_ok=True)
-            torch.save({
-                'epoch': epoch,
-                'model_state_dict': model.state_dict(),
-                'optimizer_state_dict': optimizer.state_dict(),
-                'best_acc': best_acc,
-                'classes': classes,
-                'history': history,
-                'args': vars(args)
-            }, os.path.join(args.model_dir, "model.pth"))
+            # Only rank 0 writes checkpoints
+            if rank == 0:
+                os.makedirs(args.model_dir, exist_ok=True)
+                torch.save({
+                    'epoch': epoch,
+                    'model_state_dict': model_without_ddp.state_dict(),
+                    'optimizer_state_dict': optimizer.state_dict(),
+                    'best_acc': best_acc,
+                    'classes': classes,
+                    'history': history,
+                    'args': vars(args)
+                }, os.path.join(args.model_dir, "model.pth"))
+                
+                # Inference-only artifact: no optimizer state, loadable with weights_only/mmap
+                torch.save({
+                    'model_state_dict': model_without_ddp.state_dict(),
+                    'model_name': args.model,
+                    'classes': classes
+                }, os.path.join(args.model_dir, "model_weights.pth"))
             
             print(f"💾 Model saved")
         else:
             patience_counter += 1
             print(f"⏳ No improvement ({patience_counter}/{args.patience})")
-            
-            if patience_counter >= args.patience:
-                print(f"\n🛑 Early stopping triggered!")
-                print(f"Best: {best_acc:.2f}% at epoch {best_epoch+1}")
-                break
+        
+        # Epoch boundary: resume starts the next epoch from scratch
+        if checkpointer is not None:
+            checkpointer.save(training_state(epoch + 1, 0), epoch + 1, 0)
+        
+        if patience_counter >= args.patience:
+            print(f"\n🛑 Early stopping triggered!")
+            print(f"Best: {best_acc:.2f}% at epoch {best_epoch+1}")
+            break
+    
+    if checkpointer is not None:
+        checkpointer.wait()
     
     print("\n" + "="*60)
     print("TRAINING COMPLETE")
@@ -365,14 +740,29 @@ def main():
     print(f"Final Gap: {history['train_acc'][best_epoch] - best_acc:+.2f}%")
     print("="*60)
     
-    os.makedirs(args.output_data_dir, exist_ok=True)
-    with open(os.path.join(args.output_data_dir, "training_history.json"), 'w') as f:
-        json.dump(history, f, indent=2)
-    with open(os.path.join(args.model_dir, "classes.json"), 'w') as f:
-        json.dump({'classes': classes}, f, indent=2)
+    if rank == 0:
+        os.makedirs(args.output_data_dir, exist_ok=True)
+        with open(os.path.join(args.output_data_dir, "training_history.json"), 'w') as f:
+            json.dump(history, f, indent=2)
+        with open(os.path.join(args.model_dir, "classes.json"), 'w') as f:
+            json.dump({'classes': classes}, f, indent=2)
+        
+        print(f"\n📊 History saved to {args.output_data_dir}/training_history.json")
+        print(f"📝 Classes saved to {args.model_dir}/classes.json")
+        
+        if args.profile:
+            print(f"⏱️  Profile saved to {args.output_data_dir}/training_profile.json")
+        
+        if args.export:
+            from export import export_model
+            export_model(args.model_dir, args.export)
+        
+        if args.teacher_dir:
+            compare_with_teacher(args.model_dir, args.teacher_dir, args.validation, args.output_data_dir,
+                                 val_shards=args.validation_shards, num_workers=args.num_workers)
     
-    print(f"\n📊 History saved to {args.output_data_dir}/training_history.json")
-    print(f"📝 Classes saved to {args.model_dir}/classes.json")
+    if distributed:
+        dist.destroy_process_group()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,333 @@
+import itertools
+import os
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.connection import wait
+
+import torch
+import torch.multiprocessing as mp
+
+from inference import attach_serving, input_fn, load_serving_model, model_fn, output_fn, predict_fn
+
+# How often the dispatcher checks for workers that died (OOM kill, segfault) with requests in flight
+LIVENESS_INTERVAL_SECONDS = 1.0
+
+class WorkerLostError(RuntimeError):
+    """The worker handling a request exited before answering; the request is safe to retry"""
+
+def available_cores():
+    """CPUs this process may run on (respects taskset/cgroup affinity)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def pin_threads(threads):
+    """Fix intra-op threads so that workers x threads matches the cores instead of oversubscribing"""
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Only settable before the first parallel op; the intra-op count is what matters
+
+def _worker(worker_id, model_dict, model_dir, threads, handler_threads, conn):
+    pin_threads(threads)
+    
+    # Shared weights arrive already loaded; only per-process serving state is built here
+    if model_dict is None:
+        model_dict = model_fn(model_dir)
+    else:
+        model_dict = attach_serving(model_dict, model_dir)
+    
+    # The pipe is private to this worker, so these locks never outlive a crash elsewhere
+    recv_lock = threading.Lock()
+    send_lock = threading.Lock()
+    
+    def reply(message):
+        with send_lock:
+            conn.send(message)
+    
+    def handle_tasks():
+        while True:
+            with recv_lock:
+                try:
+                    task = conn.recv()
+                except EOFError:
+                    return
+            if task is None:
+                return
+            request_id, body, content_type, accept = task
+            try:
+                response = output_fn(predict_fn(input_fn(body, content_type), model_dict), accept)
+                reply((request_id, 'ok', response))
+            except ValueError as e:
+                reply((request_id, 'invalid', str(e)))
+            except Exception as e:
+                reply((request_id, 'error', f"{type(e).__name__}: {e}"))
+    
+    # Several handler threads per worker so the micro-batcher has concurrent requests to merge
+    handlers = [threading.Thread(target=handle_tasks, daemon=True) for _ in range(handler_threads)]
+    for handler in handlers:
+        handler.start()
+    reply((None, 'ready', worker_id))
+    for handler in handlers:
+        handler.join()
+    
+    if 'batcher' in model_dict:
+        model_dict['batcher'].close()
+
+class WorkerPool:
+    """Pre-forked inference workers, each fed the next request when it has the fewest in flight
+    
+    With share_weights the eager model is loaded once in this process and its tensors are placed
+    in shared memory, so every worker maps the same weights. Without it each worker runs its own
+    model_fn, which is the N-independent-processes baseline. Each worker has its own pipe: a worker
+    killed mid-request (OOM, segfault) shows up as EOF, its requests fail with WorkerLostError and
+    a replacement is started, without a shared queue lock that a dead process could leave held.
+    """
+    
+    def __init__(self, model_dir, workers=None, threads=None, share_weights=True, handler_threads=None):
+        self.workers = workers or int(os.environ.get("INFERENCE_WORKERS", 0)) or available_cores()
+        self.threads = threads or max(1, available_cores() // self.workers)
+        self.share_weights = share_weights
+        self.handler_threads = handler_threads or max(1, int(os.environ.get("INFERENCE_MAX_BATCH_SIZE", 1)))
+        
+        model_dict = None
+        if share_weights:
+            model_dict = load_serving_model(model_dir)
+            if model_dict['backend'] != 'eager':
+                raise ValueError(f"Shared weights need the eager backend, got {model_dict['backend']}")
+            model_dict['model'].share_memory()
+            if 'fast_model' in model_dict:
+                model_dict['fast_model'].share_memory()
+        
+        self._model_dict = model_dict
+        self._model_dir = model_dir
+        self._ctx = mp.get_context("spawn")
+        self._processes = [None] * self.workers
+        self._conns = [None] * self.workers
+        self._send_locks = [threading.Lock() for _ in range(self.workers)]
+        self._in_flight = [0] * self.workers
+        for worker_id in range(self.workers):
+            self._spawn(worker_id)
+        self.restarts = 0
+        
+        # Block until every worker has its model ready, so callers never time a cold start
+        waiting = set(range(self.workers))
+        while waiting:
+            for conn in wait([self._conns[i] for i in waiting], timeout=1):
+                worker_id = self._conns.index(conn)
+                try:
+                    conn.recv()
+                except EOFError:
+                    self._terminate()
+                    raise RuntimeError(f"Inference worker {worker_id} exited while loading the model")
+                waiting.discard(worker_id)
+        
+        self._ids = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stopped = False
+        self._dispatcher = threading.Thread(target=self._dispatch, name="worker-pool-results", daemon=True)
+        self._dispatcher.start()
+    
+    def _spawn(self, worker_id):
+        conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker, name=f"inference-worker-{worker_id}", daemon=True,
+            args=(worker_id, self._model_dict, self._model_dir, self.threads, self.handler_threads, child_conn)
+        )
+        process.start()
+        # Only the worker may hold the other end, or its death would never read as EOF here
+        child_conn.close()
+        self._processes[worker_id] = process
+        self._conns[worker_id] = conn
+    
+    @property
+    def pids(self):
+        return [process.pid for process in self._processes]
+    
+    @property
+    def healthy(self):
+        """False once closed, or from a worker's death until the dispatcher notices and replaces it"""
+        return not self._closed and all(process.is_alive() for process in self._processes)
+    
+    def submit(self, body, content_type='application/x-image', accept='application/json'):
+        """Send one request to the least busy worker and return a Future resolving to the output_fn response"""
+        if self._closed:
+            raise RuntimeError("WorkerPool is closed")
+        future = Future()
+        # Running futures cannot be cancelled, so a late result never races a cancel()
+        future.set_running_or_notify_cancel()
+        request_id = next(self._ids)
+        with self._lock:
+            running = [i for i, conn in enumerate(self._conns) if conn is not None]
+            if not running:
+                future.set_exception(WorkerLostError("No inference worker is running"))
+                return future
+            worker_id = min(running, key=self._in_flight.__getitem__)
+            self._pending[request_id] = (future, worker_id)
+            self._in_flight[worker_id] += 1
+            conn = self._conns[worker_id]
+        try:
+            with self._send_locks[worker_id]:
+                conn.send((request_id, body, content_type, accept))
+        except OSError:
+            # Worker died between choosing it and sending; the dispatcher may already have failed it
+            if self._take(request_id) is not None:
+                future.set_exception(WorkerLostError(f"Inference worker {worker_id} is not running"))
+        return future
+    
+    def invoke(self, body, content_type='application/x-image', accept='application/json', timeout=None):
+        """Blocking helper: submit and wait for the response
+        
+        Raises concurrent.futures.TimeoutError after timeout seconds; a late result is then dropped.
+        """
+        return self.submit(body, content_type, accept).result(timeout)
+    
+    def close(self):
+        """Stop workers after draining requests already sent"""
+        if self._closed:
+            return
+        self._closed = True
+        for worker_id, conn in enumerate(list(self._conns)):
+            if conn is None:
+                continue
+            try:
+                with self._send_locks[worker_id]:
+                    for _ in range(self.handler_threads):
+                        conn.send(None)
+            except OSError:
+                pass
+        for process in self._processes:
+            process.join(timeout=30)
+        self._terminate()
+        self._stopped = True
+        self._dispatcher.join()
+        
+        # Anything still pending lost its worker
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future, _ in pending.values():
+            future.set_exception(RuntimeError("WorkerPool closed before the request completed"))
+    
+    def _terminate(self):
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+    
+    def _take(self, request_id):
+        """Remove a pending request; None if it was already answered or failed"""
+        with self._lock:
+            future, worker_id = self._pending.pop(request_id, (None, None))
+            if future is not None:
+                self._in_flight[worker_id] -= 1
+            return future
+    
+    def _dispatch(self):
+        while not self._stopped:
+            conns = {conn: worker_id for worker_id, conn in enumerate(self._conns) if conn is not None}
+            for conn in wait(list(conns), timeout=LIVENESS_INTERVAL_SECONDS):
+                worker_id = conns[conn]
+                try:
+                    request_id, status, payload = conn.recv()
+                except (EOFError, OSError):
+                    self._worker_lost(worker_id)
+                    continue
+                future = self._take(request_id)
+                if future is None:
+                    continue  # A replacement worker's 'ready'
+                if status == 'ok':
+                    future.set_result(payload)
+                elif status == 'invalid':
+                    future.set_exception(ValueError(payload))
+                else:
+                    future.set_exception(RuntimeError(payload))
+            
+            # A wedged worker can be dead without its pipe closing yet
+            for worker_id, process in enumerate(self._processes):
+                if self._conns[worker_id] is not None and not process.is_alive():
+                    self._worker_lost(worker_id)
+    
+    def _worker_lost(self, worker_id):
+        """Fail the requests a dead worker was handling and, unless closing, start a replacement"""
+        process = self._processes[worker_id]
+        with self._lock:
+            # No new requests go to this worker from here on
+            conn, self._conns[worker_id] = self._conns[worker_id], None
+            lost = [request_id for request_id, (_, owner) in self._pending.items() if owner == worker_id]
+            futures = [self._pending.pop(request_id)[0] for request_id in lost]
+            self._in_flight[worker_id] = 0
+        conn.close()
+        process.join(timeout=5)
+        if self._closed:
+            for future in futures:
+                future.set_exception(RuntimeError("WorkerPool closed before the request completed"))
+            return
+        
+        print(f"⚠️  Inference worker {worker_id} (pid {process.pid}) exited with code {process.exitcode}; "
+              f"failing {len(futures)} in-flight requests and restarting it")
+        for future in futures:
+            future.set_exception(WorkerLostError(f"Inference worker exited with code {process.exitcode}"))
+        if process.is_alive():
+            process.terminate()
+        self._spawn(worker_id)
+        self.restarts += 1
+
+def serve(pool, host="0.0.0.0", port=8080, timeout=None):
+    """/ping and /invocations in front of a worker pool"""
+    timeout = timeout or float(os.environ.get("INFERENCE_REQUEST_TIMEOUT_SECONDS", 60))
+    
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        
+        def do_GET(self):
+            if self.path == "/ping":
+                # Unhealthy from a worker crash until its replacement is started
+                self.send_response(200 if pool.healthy else 503)
+            else:
+                self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                response, content_type = pool.invoke(body, self.headers.get("Content-Type", "application/x-image"),
+                                                     self.headers.get("Accept", "application/json"),
+                                                     timeout=timeout)
+                response = response.encode()
+                self.send_response(200)
+            except ValueError as e:
+                response, content_type = str(e).encode(), "text/plain"
+                self.send_response(400)
+            except FutureTimeoutError:
+                response, content_type = f"No response within {timeout:.0f}s".encode(), "text/plain"
+                self.send_response(504)
+            except WorkerLostError as e:
+                response, content_type = str(e).encode(), "text/plain"
+                self.send_response(503)
+            except Exception as e:
+                # A failed model call (already "Type: message" from the worker) or a closed pool
+                response, content_type = str(e).encode(), "text/plain"
+                self.send_response(500)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"Serving {pool.workers} workers x {pool.threads} threads on {host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        pool.close()
+
+if __name__ == '__main__':
+    serve(WorkerPool(os.environ.get("SM_MODEL_DIR", "/opt/ml/model")),
+          port=int(os.environ.get("INFERENCE_PORT", 8080)))